@@ -0,0 +1,77 @@
+import os
+import glob
+import gzip
+import json
+
+
+class ResponseArchive():
+    """
+    Append-only archive of raw data call responses kept in a directory.
+
+    In record mode, every response is appended as a JSON line to a gzip file
+    of the recording process. Each run appends a new gzip member, so earlier
+    recordings are never rewritten. In replay mode, all recordings in the
+    directory are loaded and served by query instead of the network. If a
+    query is recorded more than once, the latest recording wins.
+
+    Records are keyed by query, i.e. '<data_call>/data.json?<test_input>',
+    so a recording can be replayed regardless of the host it was taken from.
+    """
+
+    def __init__(self, path, replay=False):
+
+        self.path = path
+        self.replay = replay
+
+        self._file = None
+        self._responses = None
+
+    def __reduce__(self):
+        # Open files and loaded responses stay in the process that owns them,
+        # worker processes record into / load from the directory on their own.
+        return (ResponseArchive, (self.path, self.replay))
+
+    def record(self, query, url, status, headers, elapsed, body, error=None):
+        """
+        Append a response to the archive. error is the MessageEnum code the
+        response resulted in, if any (e.g. BAD_GATEWAY for non-JSON bodies).
+        """
+
+        if self._file is None:
+            os.makedirs(self.path, exist_ok=True)
+            file_path = os.path.join(self.path, f"responses-{os.getpid()}.jsonl.gz")
+            self._file = gzip.open(file_path, "at", encoding="utf-8")
+
+        record = {
+            "query": query,
+            "url": url,
+            "status": status,
+            "headers": headers,
+            "elapsed": round(elapsed, 6),
+            "error": error,
+            "body": body.decode("utf-8", errors="replace") if body is not None else None
+        }
+
+        self._file.write(json.dumps(record, separators=(',', ':')) + "\n")
+
+    def get(self, query):
+        """Return the recorded response of query, or None if there is not any"""
+
+        if self._responses is None:
+            self._responses = {}
+
+            file_paths = glob.glob(os.path.join(self.path, "*.jsonl.gz"))
+
+            for file_path in sorted(file_paths, key=os.path.getmtime):
+                with gzip.open(file_path, "rt", encoding="utf-8") as archive_file:
+                    for line in archive_file:
+                        record = json.loads(line)
+                        self._responses[record["query"]] = record
+
+        return self._responses.get(query)
+
+    def close(self):
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,84 @@
+from core.config import ADAPTIVE_INITIAL_LIMIT, ADAPTIVE_MIN_ROUND, ADAPTIVE_MAX_ERROR_RATE, \
+    ADAPTIVE_LATENCY_TOLERANCE, ADAPTIVE_DECREASE, ADAPTIVE_INCREASE
+from core.histogram import LatencyHistogram
+
+
+class ConcurrencyLimit():
+    """
+    AIMD controller of the number of tests kept in flight, between 1 and
+    max_limit. Completed tests are observed in rounds of about `limit` tests,
+    i.e. roughly one round trip of the window each. The limit grows after a
+    healthy round and is cut multiplicatively after a round in which the host
+    shows overload: time-outs and 502s, or p95 latency well above the lowest
+    p95 seen. Hence a run settles at the highest concurrency the host can
+    sustain. See ADAPTIVE_* in core/config.py for the thresholds.
+
+    Latencies are taken relative to the fastest test of their data call, as
+    test cases come grouped by data call and a run moving on to slower data
+    calls would otherwise look like an overloaded host.
+    """
+
+    def __init__(self, max_limit, initial_limit=ADAPTIVE_INITIAL_LIMIT):
+
+        self.max_limit = max_limit
+        self.limit = max(1, min(initial_limit, max_limit))
+
+        # The limit doubles until the host first shows overload
+        self.slow_start = True
+        self.min_p95 = None
+
+        self.num_increases = 0
+        self.num_decreases = 0
+        self.peak_limit = self.limit
+
+        self._min_latencies = {}
+        self._histogram = LatencyHistogram()
+        self._num_errors = 0
+
+    def __call__(self):
+        return self.limit
+
+    def record(self, data_call, latency, overloaded=False):
+        """Observe a completed test, which timed out or got 502 if overloaded"""
+
+        min_latency = min(self._min_latencies.get(data_call, latency), latency)
+        self._min_latencies[data_call] = min_latency
+
+        self._histogram.record(latency / min_latency if min_latency > 0 else 1)
+        self._num_errors += overloaded
+
+        if self._histogram.count >= max(self.limit, ADAPTIVE_MIN_ROUND):
+            self._adjust()
+
+    def _adjust(self):
+
+        p95 = self._histogram.percentile(95)
+        error_rate = self._num_errors / self._histogram.count
+
+        if self.min_p95 is None or p95 < self.min_p95:
+            self.min_p95 = p95
+
+        if error_rate > ADAPTIVE_MAX_ERROR_RATE or p95 > self.min_p95 * ADAPTIVE_LATENCY_TOLERANCE:
+            self.slow_start = False
+            self.limit = max(1, int(self.limit * ADAPTIVE_DECREASE))
+            self.num_decreases += 1
+
+        elif self.limit < self.max_limit:
+            if self.slow_start:
+                self.limit = min(self.limit * 2, self.max_limit)
+            else:
+                self.limit = min(self.limit + ADAPTIVE_INCREASE, self.max_limit)
+
+            self.num_increases += 1
+            self.peak_limit = max(self.peak_limit, self.limit)
+
+        self._histogram = LatencyHistogram()
+        self._num_errors = 0
+
+    def format_stats(self):
+
+        return (
+            f"Adaptive concurrency: {self.limit} tests in flight at the end, "
+            f"{self.peak_limit} at most, of {self.max_limit} allowed "
+            f"({self.num_increases} increases, {self.num_decreases} decreases)"
+        )
@@ -22,6 +22,111 @@
 # Application-wide definitions
 BATCH_SIZE = 100
 
+# Extension of test suites compiled from CSV files, see core/suite.py
+SUITE_EXTENSION = ".suite"
+
+# Minimum number of seconds between two progress reports of a CLI run
+PROGRESS_INTERVAL = 5
+
+# Maximum number of seconds results written into a file stay in its buffer
+SINK_FLUSH_INTERVAL = 5
+
+# Minimum number of blocks of a nested param to look them up through an index
+# of their MATCH-ed fields instead of scanning them one by one
+NESTED_INDEX_MIN_BLOCKS = 32
+
+# Number of compiled assertion plans kept for expected outputs that recur,
+# least recently used ones are dropped beyond it
+PLAN_CACHE_SIZE = 4096
+
+# Size in bytes of responses to evaluate in other processes, 0 means never
+OFFLOAD_THRESHOLD = 0
+
+# Adaptive concurrency, see core/concurrency.py: the number of tests in flight
+# starts at ADAPTIVE_INITIAL_LIMIT and is adjusted after each round of at least
+# ADAPTIVE_MIN_ROUND completed tests. It is cut by ADAPTIVE_DECREASE if more
+# than ADAPTIVE_MAX_ERROR_RATE of a round time out or get 502, or if the p95
+# latency of a round exceeds ADAPTIVE_LATENCY_TOLERANCE times the lowest p95
+# seen so far. Otherwise it doubles until the first cut, then grows by
+# ADAPTIVE_INCREASE per round.
+ADAPTIVE_INITIAL_LIMIT = 10
+ADAPTIVE_MIN_ROUND = 20
+ADAPTIVE_MAX_ERROR_RATE = 0.02
+ADAPTIVE_LATENCY_TOLERANCE = 2
+ADAPTIVE_DECREASE = 0.7
+ADAPTIVE_INCREASE = 2
+
+# Retries of requests that time out or get a 502, see core/retry.py. The delay
+# before the n-th retry is up to RETRY_BASE_DELAY * 2 ** (n - 1) seconds, capped
+# at RETRY_MAX_DELAY. Retries are limited to RETRY_BUDGET_MIN plus
+# RETRY_BUDGET_RATIO of all requests.
+RETRIES = 0
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+RETRY_BUDGET_RATIO = 0.1
+RETRY_BUDGET_MIN = 10
+
+# Hedged requests, see core/hedge.py: a request still waiting longer than the
+# HEDGE_PERCENTILE latency of its data call is sent once more, and the first
+# response wins. Data calls are hedged once they have HEDGE_MIN_SAMPLES
+# responses, and at most HEDGE_MAX_RATIO of the requests are hedged.
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_RATIO = 0.05
+
+# Deadlines of a request in seconds, overridden per data call by its "timeout"
+# in DATA_CALL_MAP, any of:
+#   connect -> opening a TCP connection, including the TLS handshake
+#   read    -> waiting for the next chunk of the response
+#   total   -> the whole request, including waiting for a free connection
+TIMEOUT = {"total": 15}
+
+# Deadlines derived from latency history, see core/history.py: the
+# AUTO_TIMEOUT_PERCENTILE latency of a data call in past runs times
+# AUTO_TIMEOUT_FACTOR, within [AUTO_TIMEOUT_MIN, AUTO_TIMEOUT_MAX] seconds.
+# Data calls with fewer than AUTO_TIMEOUT_MIN_SAMPLES past tests keep their
+# configured deadlines.
+AUTO_TIMEOUT_PERCENTILE = 99
+AUTO_TIMEOUT_FACTOR = 3
+AUTO_TIMEOUT_MIN = 1
+AUTO_TIMEOUT_MAX = 120
+AUTO_TIMEOUT_MIN_SAMPLES = 50
+
+# Phases of a test, timed in seconds:
+#   wait     -> waiting for a free connection of the pool
+#   shared   -> waiting for the response of an identical request in flight,
+#               sent by another test, whose phases are counted for that test
+#   dns      -> resolving the host
+#   connect  -> opening a TCP connection, including the TLS handshake
+#   ttfb     -> from sending the request until the response headers arrive
+#   transfer -> reading the response body
+#   decode   -> decoding JSON of the response body
+#   eval     -> evaluating the response against the expected output
+#   backoff  -> waiting to retry the request, see RETRIES
+# Phases of a retried request add up over its attempts.
+TIMING_PHASES = (
+    "wait", "shared", "dns", "connect", "ttfb", "transfer", "decode", "eval", "backoff"
+)
+
+# Connection pool defaults, 0 means no limit
+POOL_SIZE = 200
+POOL_SIZE_PER_HOST = 0
+KEEPALIVE_TIMEOUT = 30
+DNS_CACHE_TTL = 300
+
+# The GUI runs tests on a worker thread, which sends results to the window in
+# batches, at most every this many seconds
+GUI_BATCH_INTERVAL = 0.1
+
+# The window shows the results it has received at most once per this many
+# seconds, coalescing the batches that arrive in between
+GUI_FRAME_INTERVAL = 0.05
+
+# Seconds the GUI waits after the last keystroke before searching tests, and
+# number of tests indexed for search at a time while the GUI stays responsive
+GUI_SEARCH_DELAY = 0.15
+GUI_INDEX_CHUNK = 1000
+
 MATTERMOST_URL = "https://mattermost.ripe.net/hooks/6xp8tt93i3fwde5d43jegsxi8a"
 MATTERMOST_CHANNEL = "ripestat-teststat"
 
@@ -119,10 +224,13 @@ class ParamsCommons():
     }
 
 
+# A data call may set "timeout" to override TIMEOUT with its own deadlines, e.g.
+# {"total": 60} for a data call that is slow by nature, see core/history.py
 DATA_CALL_MAP = {
 
     "abuse-contact-finder": {
         "data_call_name": "Abuse Contact Finder",
+        "timeout": {"total": 5},
         "required_params": ["resource"],
         "optional_params": [],
         "output_params": {
@@ -441,6 +549,7 @@ DATA_CALL_MAP = {
 
     "bgplay": {
         "data_call_name": "BGPlay",
+        "timeout": {"total": 60},
         "required_params": ["resource"],
         "optional_params": ["starttime", "endtime", "rrcs", "unix_timestamps"],
         "output_params": {
@@ -566,6 +675,7 @@ DATA_CALL_MAP = {
     # might require change
     "historical-whois": {
         "data_call_name": "Historical Whois",
+        "timeout": {"total": 30},
         "required_params": ["resource"],
         "optional_params": ["version"],
         "output_params": {
@@ -647,6 +757,7 @@ DATA_CALL_MAP = {
 
     "looking-glass": {
         "data_call_name": "Looking Glass",
+        "timeout": {"total": 30},
         "required_params": ["resource"],
         "optional_params": ["look_back_limit"],
         "output_params": {
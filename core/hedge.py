@@ -0,0 +1,49 @@
+from core.config import HEDGE_PERCENTILE, HEDGE_MAX_RATIO, HEDGE_MIN_SAMPLES
+from core.histogram import LatencyHistogram
+
+
+class HedgePolicy():
+    """
+    When to hedge a request, i.e. send a duplicate of it, which races the
+    original one. A request is hedged once it has been waiting longer than
+    the HEDGE_PERCENTILE latency observed so far for its data call, so only
+    stragglers are duplicated. Data calls with fewer than HEDGE_MIN_SAMPLES
+    responses are not hedged yet. Hedges are capped at HEDGE_MAX_RATIO of all
+    requests, so that hedging does not add meaningful load to the host.
+    """
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, max_ratio=HEDGE_MAX_RATIO):
+
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+
+        self.histograms = {}
+
+        self.num_requests = 0
+        self.num_hedges = 0
+        self.num_hedge_wins = 0
+
+    def record(self, data_call, seconds):
+        """Observe the latency of a response of data_call"""
+
+        self.histograms.setdefault(data_call, LatencyHistogram()).record(seconds)
+
+    def get_delay(self, data_call):
+        """Return seconds after which a request of data_call is hedged, or None if never"""
+
+        histogram = self.histograms.get(data_call)
+
+        if histogram is None or histogram.count < HEDGE_MIN_SAMPLES:
+            return None
+
+        return histogram.percentile(self.percentile) / 1000
+
+    def acquire(self):
+        """Return whether a hedge can be sent within the cap, counting it if so"""
+
+        if self.num_hedges >= self.max_ratio * self.num_requests:
+            return False
+
+        self.num_hedges += 1
+
+        return True
@@ -0,0 +1,95 @@
+from math import ceil, floor, log2
+from collections import Counter
+
+
+# Each doubling of latency is split into this many buckets, so that values
+# of a bucket are within ~9% of each other
+BUCKETS_PER_DOUBLING = 8
+
+# Latencies below this many milliseconds all fall into the same bucket
+MIN_LATENCY = 0.01
+
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram():
+    """
+    Histogram of latencies with logarithmic buckets. Recording a latency is
+    a single counter increment and histograms of several runs or processes
+    can be merged into one without losing precision. Percentiles are
+    estimated from the buckets, whereas count and max are exact.
+    """
+
+    def __init__(self):
+
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0
+
+    def record(self, seconds):
+
+        milliseconds = max(seconds * 1000, MIN_LATENCY)
+
+        self.buckets[floor(log2(milliseconds) * BUCKETS_PER_DOUBLING)] += 1
+        self.count += 1
+        self.max = max(self.max, milliseconds)
+
+    def merge(self, other):
+
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Return the estimated latency in milliseconds at given percentile"""
+
+        if not self.count:
+            return 0
+
+        rank = ceil(percent / 100 * self.count)
+        num_seen = 0
+
+        for bucket in sorted(self.buckets):
+            num_seen += self.buckets[bucket]
+
+            if num_seen >= rank:
+                # Geometric middle of the bucket, which cannot exceed the max
+                return min(2 ** ((bucket + 0.5) / BUCKETS_PER_DOUBLING), self.max)
+
+        return self.max
+
+    def summary(self):
+        """Return count, percentiles and max in milliseconds"""
+
+        summary = {"count": self.count}
+
+        for percent in PERCENTILES:
+            summary[f"p{percent}"] = round(self.percentile(percent), 3)
+
+        summary["max"] = round(self.max, 3)
+
+        return summary
+
+    def to_dict(self):
+
+        return {
+            **self.summary(),
+            "buckets_per_doubling": BUCKETS_PER_DOUBLING,
+            "buckets": {str(bucket): count for bucket, count in sorted(self.buckets.items())}
+        }
+
+    @classmethod
+    def from_dict(cls, histogram_dict):
+        """Load a histogram exported by to_dict, raise ValueError if its buckets differ"""
+
+        if histogram_dict["buckets_per_doubling"] != BUCKETS_PER_DOUBLING:
+            raise ValueError("Histogram has buckets of another size")
+
+        histogram = cls()
+        histogram.buckets.update(
+            {int(bucket): count for bucket, count in histogram_dict["buckets"].items()}
+        )
+        histogram.count = histogram_dict["count"]
+        histogram.max = histogram_dict["max"]
+
+        return histogram
@@ -0,0 +1,139 @@
+import os
+import json
+
+from core.config import DATA_CALL_MAP, TIMEOUT, AUTO_TIMEOUT_PERCENTILE, AUTO_TIMEOUT_FACTOR, \
+    AUTO_TIMEOUT_MIN, AUTO_TIMEOUT_MAX, AUTO_TIMEOUT_MIN_SAMPLES
+from core.histogram import LatencyHistogram
+
+
+# Deadlines of a request and the latency each is derived from: the whole test
+# for total, and the phase the deadline applies to for the others
+TIMEOUT_SOURCES = {"connect": "connect", "read": "ttfb", "total": "total"}
+
+# Phases of a single try of a request, which its deadlines apply to
+REQUEST_PHASES = ("wait", "dns", "connect", "ttfb", "transfer")
+
+
+def get_timeout(data_call):
+    """Return deadlines of data_call, i.e. TIMEOUT with its own in DATA_CALL_MAP"""
+
+    return {**TIMEOUT, **DATA_CALL_MAP.get(data_call, {}).get("timeout", {})}
+
+
+def get_test_key(test_case):
+    """Return the key of test_case in the history, i.e. the query it sends"""
+
+    return f"{test_case.data_call}/data.json?{test_case.query_input}"
+
+
+class LatencyHistory():
+    """
+    Latency histograms per data call, kept across runs in a JSON file at
+    path: one of requests and one per phase a deadline applies to, see
+    TIMEOUT_SOURCES. Deadlines of a data call are derived from its history
+    as the AUTO_TIMEOUT_PERCENTILE latency times AUTO_TIMEOUT_FACTOR, so fast
+    data calls fail fast and slow ones stop timing out spuriously.
+
+    The last duration of each test is kept as well, to run the longest tests
+    first, see order_test_cases.
+    """
+
+    def __init__(self, path=None):
+
+        self.path = path
+        self.data_calls = {}
+        self.tests = {}
+
+        if path and os.path.exists(path):
+            with open(path) as file_reader:
+                history = json.load(file_reader)
+
+            for data_call, histograms in history["data_calls"].items():
+                self.data_calls[data_call] = {
+                    source: LatencyHistogram.from_dict(histogram)
+                    for source, histogram in histograms.items()
+                }
+
+            self.tests = history.get("tests", {})
+
+    def record(self, test_case, latency, timing, attempts=None):
+        """
+        Observe test_case, which took latency seconds, timing per phase. If
+        its request was retried, attempts lists the timing of each try.
+        """
+
+        self.tests[get_test_key(test_case)] = round(latency, 6)
+
+        # Deadlines apply to each try of a request, so only the last try is
+        # recorded, without earlier tries, backoff and evaluation
+        request_timing = attempts[-1] if attempts else timing
+        request_time = sum(request_timing.get(phase, 0) for phase in REQUEST_PHASES)
+
+        histograms = self.data_calls.setdefault(test_case.data_call, {})
+        histograms.setdefault("total", LatencyHistogram()).record(request_time)
+
+        for source in TIMEOUT_SOURCES.values():
+            if source in request_timing:
+                histograms.setdefault(source, LatencyHistogram()).record(request_timing[source])
+
+    def merge(self, other):
+
+        for data_call, other_histograms in other.data_calls.items():
+            histograms = self.data_calls.setdefault(data_call, {})
+
+            for source, histogram in other_histograms.items():
+                histograms.setdefault(source, LatencyHistogram()).merge(histogram)
+
+        self.tests.update(other.tests)
+
+    def save(self):
+
+        with open(self.path, "w") as file_writer:
+            json.dump(
+                {
+                    "data_calls": {
+                        data_call: {
+                            source: histogram.to_dict()
+                            for source, histogram in sorted(histograms.items())
+                        }
+                        for data_call, histograms in sorted(self.data_calls.items())
+                    },
+                    "tests": self.tests
+                },
+                file_writer,
+                indent=4
+            )
+
+    def get_timeout(self, data_call):
+        """
+        Return deadlines of data_call derived from its history, falling back
+        to the configured ones, see get_timeout, where history is too short
+        """
+
+        timeout = get_timeout(data_call)
+        histograms = self.data_calls.get(data_call, {})
+
+        for deadline, source in TIMEOUT_SOURCES.items():
+            histogram = histograms.get(source)
+
+            if histogram is None or histogram.count < AUTO_TIMEOUT_MIN_SAMPLES:
+                continue
+
+            seconds = histogram.percentile(AUTO_TIMEOUT_PERCENTILE) / 1000 * AUTO_TIMEOUT_FACTOR
+            timeout[deadline] = round(min(max(seconds, AUTO_TIMEOUT_MIN), AUTO_TIMEOUT_MAX), 3)
+
+        return timeout
+
+    def get_expected_duration(self, test_case):
+        """
+        Return seconds test_case is expected to take: its last duration, or
+        the median of its data call if it has not been run yet, or 0
+        """
+
+        duration = self.tests.get(get_test_key(test_case))
+
+        if duration is None:
+            histogram = self.data_calls.get(test_case.data_call, {}).get("total")
+            duration = histogram.percentile(50) / 1000 if histogram is not None else 0
+
+        return duration
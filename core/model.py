@@ -0,0 +1,183 @@
+class TestCase():
+    """
+    A test case, parsed once from a CSV row, a compiled suite or the GUI
+    table and shared by the CLI runs, version comparison and the GUI.
+        test_input      -> query string, e.g. 'resource=1111&sort_by=count'
+        expected_output -> {param: expected value}, including 'status_code'
+        version         -> preferred version of the data call to query, if any
+    """
+
+    __slots__ = ("row_index", "data_call", "test_input", "expected_output", "version")
+
+    def __init__(self, row_index, data_call, test_input, expected_output, version=None):
+
+        self.row_index = row_index
+        self.data_call = data_call
+        self.test_input = test_input
+        self.expected_output = expected_output
+        self.version = version
+
+    def __repr__(self):
+        return (
+            f"TestCase({self.row_index!r}, {self.data_call!r}, {self.test_input!r}, "
+            f"{self.expected_output!r}, {self.version!r})"
+        )
+
+    def __eq__(self, other):
+
+        if not isinstance(other, TestCase):
+            return NotImplemented
+
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    @classmethod
+    def from_row(cls, row_index, row):
+        """
+        Parse a CSV row, or return None if the row is malformed:
+            bgplay,resource = 1111;sort_by = count,status_code = 200;nr_routes = >5
+        ->  test_input = 'resource=1111&sort_by=count'
+            expected_output = {'status_code': '200', 'nr_routes': '>5'}
+        """
+
+        if len(row) != 3:
+            return None
+
+        data_call, test_input, csv_expected_output = row
+
+        test_input = test_input.replace(' ', '').replace('&', ',').replace(';', '&')
+
+        expected_output = {}
+        for param_value_pair in csv_expected_output.split(';'):
+            if '=' not in param_value_pair:
+                return None
+
+            param, value = param_value_pair.replace(' ', '').split('=', 1)
+            expected_output[param] = value.replace('&', ',')
+
+        if "status_code" not in expected_output:
+            return None
+
+        return cls(row_index, data_call, test_input, expected_output)
+
+    @classmethod
+    def from_table(cls, row_index, data_call, test_input, expected_output):
+        """
+        Parse the texts of a row of the GUI table, where params are given line
+        by line. Expected values are compared in lower case there.
+        """
+
+        test_input = test_input.replace("\n", '&').replace(' ', '')
+        expected_pairs = expected_output.lower().replace(' ', '').split("\n")
+
+        expected_output = {}
+        for param_value_pair in expected_pairs:
+            # Inputs may include more than one '='
+            param, value = param_value_pair.split('=', 1)
+            expected_output[param] = value
+
+        return cls(row_index, data_call, test_input, expected_output)
+
+    def to_table(self):
+        """Format the test case into the texts of a GUI table row, the inverse of from_table"""
+
+        table_test_input = "\n".join(
+            pair.replace('=', " = ", 1) for pair in self.test_input.split('&') if pair
+        )
+        table_expected_output = "\n".join(
+            f"{param} = {value}" for param, value in self.expected_output.items()
+        )
+
+        return self.data_call, table_test_input, table_expected_output
+
+    def renumber(self, row_index, version=None):
+        """Return a copy of the test case at row_index, querying given version"""
+
+        return TestCase(
+            row_index,
+            self.data_call,
+            self.test_input,
+            self.expected_output,
+            version
+        )
+
+    @property
+    def query_input(self):
+        """Query string to send, including the preferred version"""
+
+        if self.version:
+            return f"{self.test_input}&preferred_version={self.version}"
+
+        return self.test_input
+
+    @property
+    def title(self):
+        """Data call name for reports, e.g. 'Abuse Contact Finder (v2.1)'"""
+
+        title = self.data_call.replace('-', ' ').title()
+
+        if self.version:
+            title += f" (v{self.version})"
+
+        return title
+
+
+class TestResult():
+    """
+    Outcome of a test case:
+        status   -> PASSED, FAILED or TIMED_OUT
+        output   -> {param: actual value} of the params that did not match, or
+                    {"error": message} if the test could not be evaluated
+        latency  -> seconds the test took
+        timing   -> seconds spent per phase, see TIMING_PHASES
+        attempts -> phases, seconds and error of each try, if the request was
+                    retried, see RetryPolicy
+        error    -> MessageEnum code if the test could not be executed, e.g.
+                    CONNECTION_ERROR, None otherwise
+    """
+
+    PASSED = "passed"
+    FAILED = "failed"
+    TIMED_OUT = "timed-out"
+
+    __slots__ = ("test_case", "status", "output", "url", "latency", "timing", "attempts", "error")
+
+    def __init__(
+        self,
+        test_case,
+        status,
+        output=None,
+        url=None,
+        latency=None,
+        timing=None,
+        attempts=None,
+        error=None
+    ):
+
+        self.test_case = test_case
+        self.status = status
+        self.output = output
+        self.url = url
+        self.latency = latency
+        self.timing = timing
+        self.attempts = attempts
+        self.error = error
+
+    @property
+    def flaked(self):
+        """Whether the test passed only after retrying its request"""
+
+        return self.status == TestResult.PASSED and bool(self.attempts)
+
+    def to_dict(self):
+
+        return {
+            "test_case": self.test_case.row_index,
+            "data_call": self.test_case.title,
+            "url": self.url,
+            "status": self.status,
+            "latency": round(self.latency, 6) if self.latency is not None else None,
+            "expected_output": self.test_case.expected_output,
+            "actual_output": self.output,
+            "timing": self.timing,
+            "attempts": self.attempts
+        }
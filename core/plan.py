@@ -0,0 +1,494 @@
+import operator
+from functools import lru_cache
+from collections import namedtuple
+
+from core.utils import get_innermost_value, reshape_param_set
+from core.config import ALL, ANY, COMPARE, INCLUDE, INCLUDE_KEYS, MATCH, NOT_EMPTY, TRIM_AS
+from core.config import DATA_CALL_MAP, NESTED_INDEX_MIN_BLOCKS, PLAN_CACHE_SIZE, ParamsCommons
+
+
+# An expected output compiled into an immutable assertion plan:
+#   status_code -> expected status code, checked before anything else
+#   params      -> ParamCheck of each expected param, in the given order
+#   nested      -> NestedCheck of each NESTED_PARAMS group
+# Plans consist of tuples and module-level functions only, so that they can
+# be sent to other processes along with the responses to evaluate.
+AssertionPlan = namedtuple("AssertionPlan", ["data_call", "status_code", "params", "nested"])
+
+# Regular param evaluated as rule (ANY/ALL) over predicates at path. Nested
+# params are only checked for presence of their root key here.
+ParamCheck = namedtuple("ParamCheck", ["param", "root", "path", "is_nested", "rule", "predicates"])
+
+# A nested param group passes if a block of the response list at root has
+# all keys and passes all fields, or if the list is not empty for notempty.
+# A block can only pass if its values at index_paths equal index_values, i.e.
+# the fields that have to MATCH, so large lists are looked up by them.
+NestedCheck = namedtuple(
+    "NestedCheck",
+    ["root", "is_notempty", "keys", "fields", "index_paths", "index_values"]
+)
+
+# Field of a block, path is relative to the block
+FieldCheck = namedtuple("FieldCheck", ["path", "is_notempty", "rule", "predicates"])
+
+# Longer operators first, so that '>=' is not parsed as '>'
+COMPARISON_OPERATORS = (
+    (">=", operator.ge),
+    (">", operator.gt),
+    ("<=", operator.le),
+    ("<", operator.lt)
+)
+
+NESTED_PARAM_NOT_FOUND = "No item matching all the expected inputs found!"
+PARAM_NOT_FOUND = "The output does not include this key!"
+
+
+# Predicates, each called with the compiled operand and the output value
+def _not_empty(is_notempty, output_value):
+    return is_notempty and output_value
+
+
+def _include(values, output_value):
+    return all(value in output_value for value in values)
+
+
+def _include_keys(keys, output_value):
+    return all(key in output_value.keys() for key in keys)
+
+
+def _match(expected_value, output_value):
+    return expected_value == output_value
+
+
+def _compare(comparison, output_value):
+
+    if comparison is None:
+        return False
+
+    compare, threshold = comparison
+
+    try:
+        return compare(float(output_value), threshold)
+    except (TypeError, ValueError):
+        return False
+
+
+def _compile_comparison(expected_value):
+    """Return (operator, threshold) of expressions like '>=5', or None"""
+
+    for symbol, compare in COMPARISON_OPERATORS:
+        if symbol in expected_value:
+            try:
+                return compare, float(expected_value.split(symbol)[1])
+            except ValueError:
+                return None
+
+    return None
+
+
+def _compile_predicates(flags, expected_value):
+    """
+    Compile the flags of a param from DATA_CALL_MAP against its expected
+    value. Flags before ANY/ALL filter the expected value, the rest become
+    (predicate, operand) pairs. Returns rule and predicates.
+    """
+
+    flags = list(flags)
+    rule = flags.pop(0)
+
+    # Apply filters before ANY/ALL if there are such
+    while rule not in [ANY, ALL]:
+        if rule == TRIM_AS and expected_value.startswith("as"):
+            expected_value = expected_value[2:]
+
+        # No rule to apply, nothing can pass
+        if not flags:
+            return ANY, ()
+
+        rule = flags.pop(0)
+
+    predicates = []
+
+    for flag in flags:
+        if flag == NOT_EMPTY:
+            predicates.append((_not_empty, expected_value == "notempty"))
+        elif flag == INCLUDE:
+            predicates.append((_include, frozenset(expected_value.split(','))))
+        elif flag == INCLUDE_KEYS:
+            predicates.append((_include_keys, frozenset(expected_value.split(','))))
+        elif flag == MATCH:
+            predicates.append((_match, expected_value))
+        elif flag == COMPARE:
+            predicates.append((_compare, _compile_comparison(expected_value)))
+
+    return rule, tuple(predicates)
+
+
+def _get_flags(param, output_params):
+    """
+    Return flags of param. If param is unknown to DATA_CALL_MAP or has no
+    flags, return a rule without flags, i.e. one that nothing can pass.
+    """
+
+    try:
+        flags = get_innermost_value(param, output_params)
+    except (KeyError, TypeError):
+        return [ANY]
+
+    return flags if isinstance(flags, list) and flags else [ANY]
+
+
+def _compile_fields(current_level, current_identifier, output_params):
+    """
+    Flatten the reshaped fields of a nested param into FieldChecks from top
+    to bottom node, level by level.
+    """
+
+    field_checks = []
+
+    for field, expected_value in current_level.items():
+
+        if isinstance(expected_value, dict):
+            field_checks.extend(
+                _compile_fields(expected_value, f"{current_identifier}->{field}", output_params)
+            )
+            continue
+
+        # Path of the field relative to a block of the root nested param
+        path = tuple(current_identifier.split("->")[1:] + [field])
+
+        if expected_value == "notempty":
+            field_checks.append(FieldCheck(path, True, None, ()))
+        else:
+            flags = _get_flags(f"{current_identifier}->{field}", output_params)
+            rule, predicates = _compile_predicates(flags, expected_value)
+            field_checks.append(FieldCheck(path, False, rule, predicates))
+
+    return field_checks
+
+
+def _get_index_fields(field_checks):
+    """
+    Return paths and expected values of the fields that can only pass if
+    they are equal to their expected value.
+    """
+
+    index_paths = []
+    index_values = []
+
+    for field in field_checks:
+
+        if field.is_notempty:
+            continue
+
+        if field.rule == ALL:
+            matches = [operand for predicate, operand in field.predicates if predicate is _match]
+
+        else:
+            # Predicates that are False for any output value do not count for ANY
+            predicates = [
+                (predicate, operand) for predicate, operand in field.predicates
+                if not (predicate in (_not_empty, _compare) and not operand)
+            ]
+
+            if len(predicates) != 1 or predicates[0][0] is not _match:
+                continue
+
+            matches = [predicates[0][1]]
+
+        # Two different values to match, no block can pass. Scanning reports it.
+        if matches and all(match == matches[0] for match in matches):
+            index_paths.append(field.path)
+            index_values.append(matches[0])
+
+    return tuple(index_paths), tuple(index_values)
+
+
+def compile_plan(data_call, expected_output):
+    """
+    Compile expected_output of data_call into an AssertionPlan. The last
+    PLAN_CACHE_SIZE plans are cached, so an assertion evaluated many times
+    is compiled only once.
+    """
+
+    return _compile_plan(data_call, tuple(expected_output.items()))
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _compile_plan(data_call, expected_items):
+
+    expected_output = dict(expected_items)
+    output_params = DATA_CALL_MAP.get(data_call, {}).get("output_params", {})
+
+    status_code = expected_output.pop("status_code")
+
+    params = []
+    nested_params = {}
+
+    for param, value in expected_output.items():
+
+        root = param.split("->")[0]
+
+        # Seperate nested parameters from regular parameters
+        if root in ParamsCommons.NESTED_PARAMS:
+            nested_params[param] = value
+            params.append(ParamCheck(param, root, None, True, None, ()))
+            continue
+
+        flags = _get_flags(param, output_params)
+        rule, predicates = _compile_predicates(flags, value)
+        params.append(ParamCheck(param, root, tuple(param.split("->")), False, rule, predicates))
+
+    nested = []
+
+    for nested_param, fields in reshape_param_set(nested_params).items():
+
+        if fields == "notempty":
+            nested.append(NestedCheck(nested_param, True, (), (), (), ()))
+
+        # A single value expected for a whole nested param, no block can match it
+        elif not isinstance(fields, dict):
+            nested.append(NestedCheck(nested_param, False, None, (), (), ()))
+
+        else:
+            field_checks = tuple(_compile_fields(fields, nested_param, output_params))
+            nested.append(
+                NestedCheck(
+                    nested_param,
+                    False,
+                    tuple(fields),
+                    field_checks,
+                    *_get_index_fields(field_checks)
+                )
+            )
+
+    return AssertionPlan(data_call, status_code, tuple(params), tuple(nested))
+
+
+def _normalize_text(text):
+    return text.lower().replace(' ', '')
+
+
+def _normalize(value):
+    """
+    Make value lower case, trim whitespaces and convert bools&numbers into
+    string representations. Items of lists and dicts are normalized one level
+    deep, containers inside them are left as they are until a lookup reaches
+    them.
+    """
+
+    if isinstance(value, str):
+        return _normalize_text(value)
+
+    # Bools should be checked first, since Boolean is a subclass of int,
+    # any bool variable matches with the following isinstance too.
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+
+    elif isinstance(value, (int, float)):
+        return str(value)
+
+    elif value is None:
+        return "none"
+
+    elif isinstance(value, list):
+        return [_normalize_item(item) for item in value]
+
+    elif isinstance(value, dict):
+        return {_normalize_text(key): _normalize_item(item) for key, item in value.items()}
+
+    return value
+
+
+def _normalize_item(item):
+    return item if isinstance(item, (dict, list)) else _normalize(item)
+
+
+def _lookup(param_set, key):
+    """Return raw value of key in param_set, comparing keys in normalized form"""
+
+    try:
+        return param_set[key]
+
+    except KeyError:
+        for raw_key in param_set:
+            if _normalize_text(raw_key) == key:
+                return param_set[raw_key]
+        raise
+
+
+def _contains(param_set, key):
+
+    if key in param_set:
+        return True
+
+    return isinstance(param_set, dict) and any(
+        _normalize_text(raw_key) == key for raw_key in param_set
+    )
+
+
+def _resolve(path, param_set):
+    """
+    Return normalized value at path, taking the first item of lists along
+    the way. Only the value at the end of the path is normalized.
+    """
+
+    value = _lookup(param_set, path[0])
+
+    for key in path[1:]:
+        if isinstance(value, list):
+            value = value[0]
+        value = _lookup(value, key)
+
+    return _normalize(value)
+
+
+def _passes(rule, predicates, output_value):
+
+    if rule == ANY:
+        return any(predicate(operand, output_value) for predicate, operand in predicates)
+
+    return all(predicate(operand, output_value) for predicate, operand in predicates)
+
+
+def _passes_block(fields, block):
+
+    for field in fields:
+
+        output_value = _resolve(field.path, block)
+
+        # "notempty" could be applied to a nested parameter, such as
+        # "prefix->timelines", or to a non-nested one. The length of the
+        # output value satisfies both possibilities.
+        if field.is_notempty:
+            if not len(output_value) > 0:
+                return False
+
+        elif not _passes(field.rule, field.predicates, output_value):
+            return False
+
+    return True
+
+
+def _block_matches(check, block):
+
+    if not isinstance(block, dict):
+        block = _normalize(block)
+
+    return all(_contains(block, key) for key in check.keys) and _passes_block(check.fields, block)
+
+
+def _build_index(check, blocks):
+    """
+    Index positions of blocks by their values at check.index_paths. Returns
+    the index and positions of blocks whose values cannot be resolved.
+    """
+
+    index = {}
+    unresolved = []
+
+    for position, block in enumerate(blocks):
+
+        if not isinstance(block, dict):
+            block = _normalize(block)
+
+        try:
+            key = tuple(_resolve(path, block) for path in check.index_paths)
+        except (KeyError, IndexError, TypeError):
+            unresolved.append(position)
+            continue
+
+        # Only strings can be equal to an expected value
+        if all(isinstance(value, str) for value in key):
+            index.setdefault(key, []).append(position)
+
+    return index, unresolved
+
+
+def _get_candidates(check, blocks, indexes):
+    """
+    Return the blocks that have the expected values at check.index_paths, in
+    their order in blocks. Blocks whose values cannot be resolved are kept as
+    candidates, the full check decides on them.
+    """
+
+    if indexes is None:
+        index, unresolved = _build_index(check, blocks)
+    else:
+        key = (check.root, check.index_paths)
+        if key not in indexes:
+            indexes[key] = _build_index(check, blocks)
+        index, unresolved = indexes[key]
+
+    positions = index.get(check.index_values, [])
+
+    if unresolved:
+        positions = sorted(positions + unresolved)
+
+    return [blocks[position] for position in positions]
+
+
+def execute_plan(plan, data, indexes=None):
+    """
+    Check the data block of a response against plan, except for the status
+    code. Returns {param: val} of params that do not match. indexes is a dict
+    to keep the indexes of nested params in, so that they are built once for
+    all the plans executed on the same response.
+
+    Values are compared in normalized form, see _normalize. Normalization is
+    applied lazily along the paths that plan refers to only, the rest of the
+    response (e.g. thousands of unrelated bgplay events) is never touched.
+    """
+
+    failed_params = {}
+
+    for check in plan.params:
+
+        if not _contains(data, check.root):
+            failed_params[check.param] = PARAM_NOT_FOUND
+            continue
+
+        # Nested parameters are evaluated group by group below
+        if check.is_nested:
+            continue
+
+        output_value = _resolve(check.path, data)
+
+        if not _passes(check.rule, check.predicates, output_value):
+            failed_params[check.param] = output_value
+
+    # After dealing with all regular parameters, nested parameters are
+    # evaluated below. The following evaluation is based on the highest
+    # nested parameter in the hierarchy.
+    # Example: prefixes->timelines->startdate the nested param is prefixes
+    for check in plan.nested:
+
+        if not _contains(data, check.root):
+            continue
+
+        blocks = _lookup(data, check.root)
+        if not isinstance(blocks, list):
+            blocks = _normalize(blocks)
+
+        # If a checkbox "Not Empty" is checked for a nested parameter,
+        # check if the corresponding response list of parameter is empty
+        if check.is_notempty:
+            if not blocks:
+                failed_params[check.root] = []
+            continue
+
+        if check.keys is None:
+            failed_params[check.root] = NESTED_PARAM_NOT_FOUND
+            continue
+
+        # Only the blocks with the expected values of MATCH-ed fields can
+        # pass, look them up instead of checking all fields of all blocks
+        if check.index_paths and len(blocks) >= NESTED_INDEX_MIN_BLOCKS:
+            blocks = _get_candidates(check, blocks, indexes)
+
+        # Check if there is a block in blocks that includes all the expected
+        # fields and match with them
+        if not any(_block_matches(check, block) for block in blocks):
+            failed_params[check.root] = NESTED_PARAM_NOT_FOUND
+
+    return failed_params
@@ -0,0 +1,144 @@
+import ssl
+import time
+
+import aiohttp
+
+from core.config import POOL_SIZE, POOL_SIZE_PER_HOST, KEEPALIVE_TIMEOUT, DNS_CACHE_TTL
+
+
+class ConnectionPool():
+    """
+    Keep-alive connection pool that can be shared by several TestStat
+    instances and runs. Connections and resolved addresses outlive a single
+    query, so queries over a kept-alive connection skip the TCP and TLS
+    handshakes. TLS sessions of new connections are not resumed, only the
+    SSL context, i.e. the loaded CA bundle, is shared by all of them.
+
+    If a dict is passed to a request as trace_request_ctx, seconds spent in
+    each phase of the request are added into it, see TIMING_PHASES.
+    """
+
+    def __init__(
+        self,
+        limit=POOL_SIZE,
+        limit_per_host=POOL_SIZE_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        dns_cache_ttl=DNS_CACHE_TTL
+    ):
+
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+
+        # A single context keeps the CA bundle loaded once for all connections
+        self.ssl_context = ssl.create_default_context()
+
+        self.stats = {"opened": 0, "reused": 0, "waited": 0}
+        self._session = None
+
+    def __reduce__(self):
+        # Only the settings are sent to worker processes, each of them opens
+        # connections of its own.
+        return (
+            ConnectionPool,
+            (self.limit, self.limit_per_host, self.keepalive_timeout, self.dns_cache_ttl)
+        )
+
+    @property
+    def session(self):
+        """
+        Return the pooled session, create it on first use or if it has been
+        closed. Must be called from a coroutine.
+        """
+
+        if self._session is None or self._session.closed:
+
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                ssl=self.ssl_context
+            )
+
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_start.append(self._on_request_start)
+            trace_config.on_request_end.append(self._on_request_end)
+            trace_config.on_connection_queued_start.append(self._on_connection_waited)
+            trace_config.on_connection_queued_end.append(self._on_connection_queued_end)
+            trace_config.on_connection_create_start.append(self._on_connection_create_start)
+            trace_config.on_connection_create_end.append(self._on_connection_opened)
+            trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+            trace_config.on_dns_resolvehost_start.append(self._on_dns_resolvehost_start)
+            trace_config.on_dns_resolvehost_end.append(self._on_dns_resolvehost_end)
+
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[trace_config]
+            )
+
+        return self._session
+
+    async def close(self):
+
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def format_stats(self):
+
+        return (
+            f"Connections opened: {self.stats['opened']:,}   |   "
+            f"Reused: {self.stats['reused']:,}   |   "
+            f"Waited-for: {self.stats['waited']:,}"
+        )
+
+    # Trace callbacks. Phases are measured from start to end events, the time
+    # to first byte is what remains of the request once the others are done.
+    async def _on_request_start(self, session, trace_config_ctx, params):
+        trace_config_ctx.start_time = time.perf_counter()
+        trace_config_ctx.setup_time = 0
+
+    async def _on_request_end(self, session, trace_config_ctx, params):
+        elapsed = time.perf_counter() - trace_config_ctx.start_time
+        _add_timing(trace_config_ctx, "ttfb", elapsed - trace_config_ctx.setup_time)
+
+    async def _on_connection_waited(self, session, trace_config_ctx, params):
+        self.stats["waited"] += 1
+        trace_config_ctx.queued_time = time.perf_counter()
+
+    async def _on_connection_queued_end(self, session, trace_config_ctx, params):
+        elapsed = time.perf_counter() - trace_config_ctx.queued_time
+        trace_config_ctx.setup_time += elapsed
+        _add_timing(trace_config_ctx, "wait", elapsed)
+
+    async def _on_connection_create_start(self, session, trace_config_ctx, params):
+        trace_config_ctx.create_time = time.perf_counter()
+        trace_config_ctx.dns_elapsed = 0
+
+    async def _on_connection_opened(self, session, trace_config_ctx, params):
+        self.stats["opened"] += 1
+
+        # Creating a connection includes resolving the host, which is a phase
+        # of its own. aiohttp does not trace TLS separately from TCP.
+        elapsed = time.perf_counter() - trace_config_ctx.create_time
+        trace_config_ctx.setup_time += elapsed
+        _add_timing(trace_config_ctx, "connect", elapsed - trace_config_ctx.dns_elapsed)
+
+    async def _on_connection_reused(self, session, trace_config_ctx, params):
+        self.stats["reused"] += 1
+
+    async def _on_dns_resolvehost_start(self, session, trace_config_ctx, params):
+        trace_config_ctx.dns_time = time.perf_counter()
+
+    async def _on_dns_resolvehost_end(self, session, trace_config_ctx, params):
+        trace_config_ctx.dns_elapsed = time.perf_counter() - trace_config_ctx.dns_time
+        _add_timing(trace_config_ctx, "dns", trace_config_ctx.dns_elapsed)
+
+
+def _add_timing(trace_config_ctx, phase, elapsed):
+
+    timing = trace_config_ctx.trace_request_ctx
+
+    if isinstance(timing, dict):
+        timing[phase] = timing.get(phase, 0) + elapsed
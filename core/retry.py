@@ -0,0 +1,48 @@
+import random
+
+from core.config import RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_BUDGET_RATIO, \
+    RETRY_BUDGET_MIN
+from core.utils import MessageEnum
+
+
+class RetryPolicy():
+    """
+    Retries of requests that fail transiently, i.e. time out or get a
+    non-JSON response such as a 502 page. A request is tried up to
+    1 + max_retries times. The delay before the n-th retry is drawn uniformly
+    from [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (n - 1))] seconds,
+    so that the retries of a burst of failures spread out instead of hitting
+    the host again at once.
+
+    Retries are limited by a budget shared by all requests of a TestStat:
+    RETRY_BUDGET_MIN plus RETRY_BUDGET_RATIO of the requests made so far.
+    Hence an overloaded host that fails most requests is not flooded with
+    retries on top of them.
+    """
+
+    RETRIABLE_ERRORS = (MessageEnum.TIMEOUT, MessageEnum.BAD_GATEWAY)
+
+    def __init__(self, max_retries=RETRIES):
+
+        self.max_retries = max_retries
+
+        self.num_requests = 0
+        self.num_retries = 0
+        self.num_denied = 0
+
+    def get_delay(self, attempt, error):
+        """
+        Return seconds to wait before retrying a request whose attempt-th try
+        failed with error, or None if it is not to be retried
+        """
+
+        if error not in self.RETRIABLE_ERRORS or attempt > self.max_retries:
+            return None
+
+        if self.num_retries >= RETRY_BUDGET_MIN + RETRY_BUDGET_RATIO * self.num_requests:
+            self.num_denied += 1
+            return None
+
+        self.num_retries += 1
+
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
@@ -0,0 +1,88 @@
+import os
+import csv
+import json
+import asyncio
+
+from core.config import SINK_FLUSH_INTERVAL
+
+
+class ResultSink():
+    """
+    Write each completed test into a file as soon as it completes, as JSON
+    lines or, if path ends with '.csv', as CSV rows. Results are thus not
+    kept in memory, and the results of a killed run are kept up to the last
+    flush. Lines are buffered and flushed every SINK_FLUSH_INTERVAL seconds
+    by flush_periodically, which runs on the event loop of the tests.
+
+    Each worker process writes into a file of its own, see for_worker.
+    """
+
+    FIELDS = (
+        "test_case",
+        "data_call",
+        "url",
+        "status",
+        "latency",
+        "expected_output",
+        "actual_output",
+        "timing",
+        "attempts"
+    )
+
+    def __init__(self, path):
+
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+
+        self._file = None
+        self._csv_writer = None
+
+    def __reduce__(self):
+        # The open file stays in the process that owns it
+        return (ResultSink, (self.path,))
+
+    def for_worker(self, worker_index):
+        """Return a sink writing next to this one, e.g. results-2.jsonl for worker 2"""
+
+        root, extension = os.path.splitext(self.path)
+
+        return ResultSink(f"{root}-{worker_index}{extension}")
+
+    def write(self, **result):
+        """Write a result with given FIELDS"""
+
+        if self._file is None:
+            self._file = open(self.path, "w", newline="")
+
+            if self.is_csv:
+                self._csv_writer = csv.writer(self._file)
+                self._csv_writer.writerow(self.FIELDS)
+
+        if self.is_csv:
+            self._csv_writer.writerow(
+                [
+                    json.dumps(result.get(field)) if isinstance(result.get(field), (dict, list))
+                    else result.get(field)
+                    for field in self.FIELDS
+                ]
+            )
+        else:
+            self._file.write(json.dumps({field: result.get(field) for field in self.FIELDS}) + "\n")
+
+    def flush(self):
+
+        if self._file is not None:
+            self._file.flush()
+
+    async def flush_periodically(self):
+        """Flush every SINK_FLUSH_INTERVAL seconds until cancelled"""
+
+        while True:
+            await asyncio.sleep(SINK_FLUSH_INTERVAL)
+            self.flush()
+
+    def close(self):
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
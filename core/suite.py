@@ -0,0 +1,230 @@
+import os
+import csv
+import mmap
+import heapq
+import struct
+import hashlib
+
+from core.model import TestCase
+
+
+# Layout of a compiled test suite, all integers little-endian:
+#   header  -> magic, format version, number of records, sha256 of the source
+#              CSV file and offset of the index
+#   source  -> path of the source CSV file, relative to the suite file
+#   records -> row index and length of the fields, followed by the fields:
+#              data call, query string and expected param-value pairs, UTF-8
+#              encoded and separated by NUL, which CSV files cannot contain
+#   index   -> number of data calls, then for each data call its name, its
+#              number of records and the offsets of its records in order
+MAGIC = b"TESTSTAT"
+VERSION = 2
+HEADER = struct.Struct("<8sHI32sQ")
+RECORD = struct.Struct("<II")
+UINT32 = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+SEPARATOR = "\0"
+
+
+def _pack_string(text):
+
+    encoded = text.encode("utf-8")
+
+    return UINT32.pack(len(encoded)) + encoded
+
+
+def _hash_file(path):
+
+    file_hash = hashlib.sha256()
+
+    with open(path, "rb") as file_reader:
+        for chunk in iter(lambda: file_reader.read(1 << 20), b""):
+            file_hash.update(chunk)
+
+    return file_hash.digest()
+
+
+def compile_suite(csv_path, suite_path):
+    """
+    Compile the test cases of a CSV file into a suite file of pre-parsed
+    test cases, indexed per data call. Malformed rows are skipped. Returns
+    the number of compiled and skipped rows and the hash of the CSV file,
+    which TestSuite checks the CSV file against.
+    """
+
+    source_hash = _hash_file(csv_path)
+    source = _pack_string(
+        os.path.relpath(os.path.abspath(csv_path), os.path.dirname(os.path.abspath(suite_path)))
+    )
+
+    records = []
+    offsets_per_dc = {}
+    offset = HEADER.size + len(source)
+    num_skipped = 0
+
+    with open(csv_path) as csv_file:
+
+        csv_reader = csv.reader(csv_file, delimiter=',')
+
+        # Skip the header
+        next(csv_reader)
+
+        for row_index, row in enumerate(csv_reader, 1):
+
+            test_case = TestCase.from_row(row_index, row)
+
+            if test_case is None:
+                num_skipped += 1
+                continue
+
+            fields = [test_case.data_call, test_case.test_input]
+            for param, value in test_case.expected_output.items():
+                fields.extend([param, value])
+
+            encoded_fields = SEPARATOR.join(fields).encode("utf-8")
+            record = RECORD.pack(row_index, len(encoded_fields)) + encoded_fields
+
+            records.append(record)
+            offsets_per_dc.setdefault(test_case.data_call, []).append(offset)
+            offset += len(record)
+
+    index = [UINT32.pack(len(offsets_per_dc))]
+
+    for data_call, offsets in offsets_per_dc.items():
+        index.append(_pack_string(data_call))
+        index.append(UINT32.pack(len(offsets)))
+        index.append(b"".join(OFFSET.pack(record_offset) for record_offset in offsets))
+
+    header = HEADER.pack(MAGIC, VERSION, len(records), source_hash, offset)
+
+    # Written next to the target first, so that a half-written suite never replaces a good one
+    temp_path = f"{suite_path}.tmp"
+
+    with open(temp_path, "wb") as suite_file:
+        suite_file.write(header)
+        suite_file.write(source)
+        suite_file.writelines(records)
+        suite_file.writelines(index)
+
+    os.replace(temp_path, suite_path)
+
+    return len(records), num_skipped, source_hash.hex()
+
+
+class TestSuite():
+    """
+    Read-only view of a compiled suite file. The file is memory-mapped, so
+    only the records that are read are loaded, and the records of a data
+    call are reached through the index without scanning the others.
+
+    A suite is refused if its source CSV file has changed since it was
+    compiled. If the source is not found, e.g. the suite is shipped on its
+    own, it is read as it is.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+
+        with open(path, "rb") as suite_file:
+            self._mmap = mmap.mmap(suite_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a compiled test suite!")
+
+        magic, version, self.num_records, source_hash, index_offset = \
+            HEADER.unpack_from(self._mmap)
+
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a compiled test suite of version {VERSION}!")
+
+        source, self._records_start = self._read_string(HEADER.size)
+
+        self.source_path = os.path.normpath(
+            os.path.join(os.path.dirname(os.path.abspath(path)), source)
+        )
+        self.source_hash = source_hash.hex()
+
+        if os.path.isfile(self.source_path) and _hash_file(self.source_path) != source_hash:
+            self.close()
+            raise ValueError(
+                f"{path} is out of date, {self.source_path} has changed since it was compiled!"
+            )
+
+        # Data call -> (offset of its record offsets, number of records)
+        self.index = {}
+
+        position = index_offset
+        num_data_calls, = UINT32.unpack_from(self._mmap, position)
+        position += UINT32.size
+
+        for _ in range(num_data_calls):
+            data_call, position = self._read_string(position)
+            num_dc_records, = UINT32.unpack_from(self._mmap, position)
+            position += UINT32.size
+
+            self.index[data_call] = (position, num_dc_records)
+            position += num_dc_records * OFFSET.size
+
+        self._records_end = index_offset
+
+    def __len__(self):
+        return self.num_records
+
+    def _read_string(self, position):
+
+        length, = UINT32.unpack_from(self._mmap, position)
+        position += UINT32.size
+
+        return str(self._mmap[position:position + length], "utf-8"), position + length
+
+    def get_offsets(self, data_call):
+        """Return offsets of the records of data_call, in the order of the CSV file"""
+
+        if data_call not in self.index:
+            return []
+
+        position, num_dc_records = self.index[data_call]
+
+        return [
+            record_offset
+            for record_offset, in OFFSET.iter_unpack(
+                self._mmap[position:position + num_dc_records * OFFSET.size]
+            )
+        ]
+
+    def read(self, offset):
+        """Return the TestCase of the record at offset"""
+
+        record, _ = self._read_record(offset)
+
+        return record
+
+    def _read_record(self, position):
+
+        row_index, length = RECORD.unpack_from(self._mmap, position)
+        position += RECORD.size
+
+        fields = str(self._mmap[position:position + length], "utf-8").split(SEPARATOR)
+        expected_output = dict(zip(fields[2::2], fields[3::2]))
+
+        return TestCase(row_index, fields[0], fields[1], expected_output), position + length
+
+    def __iter__(self):
+
+        position = self._records_start
+
+        while position < self._records_end:
+            record, position = self._read_record(position)
+            yield record
+
+    def iter_data_calls(self, data_calls):
+        """Yield the records of given data calls only, in the order of the CSV file"""
+
+        for offset in heapq.merge(*[self.get_offsets(data_call) for data_call in data_calls]):
+            yield self.read(offset)
+
+    def close(self):
+        self._mmap.close()
@@ -1,15 +1,104 @@
+import re
+import json
+import time
 import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 import aiohttp
 
-from core.utils import MessageEnum, filter_param_set, reshape_param_set, get_innermost_value
-from core.config import ALL, ANY, COMPARE, INCLUDE, INCLUDE_KEYS, MATCH, NOT_EMPTY, TRIM_AS
-from core.config import DATA_CALL_MAP, ParamsCommons
+from core.pool import ConnectionPool
+from core.config import RETRIES
+from core.hedge import HedgePolicy
+from core.history import get_timeout
+from core.plan import AssertionPlan, compile_plan, execute_plan
+from core.retry import RetryPolicy
+from core.utils import MessageEnum
+
+
+# Content types accepted as JSON, the same as aiohttp's response.json() does
+JSON_CONTENT_TYPE = re.compile(r"^application/(?:[\w.+-]+?\+)?json")
+
+
+class SharedResponse():
+    """
+    Response shared by the test cases querying the same URL. body is the raw
+    response body, or MessageEnum code on failure. Evaluation does not alter
+    the response, so it is decoded once for all of them, and the indexes built
+    on it are kept for all of them as well. timing is the seconds spent in the
+    network phases of the request, see TIMING_PHASES. attempts lists the
+    phases, total seconds and error code of each try of the request.
+    evaluations keeps the evaluation in another process per AssertionPlan,
+    so a large body is sent there once for all test cases asserting alike.
+    """
+
+    __slots__ = ("body", "timing", "attempts", "indexes", "evaluations", "_data")
+
+    def __init__(self, body, timing, attempts):
+        self.body = body
+        self.timing = timing
+        self.attempts = attempts
+        self.indexes = {}
+        self.evaluations = {}
+        self._data = None
+
+    def decode(self):
+
+        if self._data is None:
+            self._data = json.loads(self.body)
+
+        return self._data
+
+
+def evaluate_body(data_call, body, expected_output):
+    """
+    Decode body and evaluate it, see TestStat.evaluate_result. Returns the
+    test result and the seconds spent on decoding and evaluation. Defined at
+    module level, so that large responses can be evaluated in other processes.
+    """
+
+    start_time = time.perf_counter()
+
+    try:
+        test_output = json.loads(body)
+    except ValueError:
+        return MessageEnum.BAD_GATEWAY, {}
+
+    decode_time = time.perf_counter()
+    test_result = TestStat.evaluate_result(data_call, test_output, expected_output)
+
+    return test_result, {
+        "decode": decode_time - start_time,
+        "eval": time.perf_counter() - decode_time
+    }
+
+
+def _pack_result(result, url, timing, return_url, return_timing):
+
+    if return_url and return_timing:
+        return result, url, timing
+    elif return_url:
+        return result, url
+    elif return_timing:
+        return result, timing
+    return result
 
 
 class TestStat():
 
-    def __init__(self, host, port=None, with_tls=True, gui=False):
+    def __init__(
+        self,
+        host,
+        port=None,
+        with_tls=True,
+        gui=False,
+        pool=None,
+        archive=None,
+        offload_threshold=0,
+        retries=RETRIES,
+        hedge=False,
+        history=None
+    ):
 
         # gui/utils.py imports PyQt5 package underneath. This is an unnecessary
         # load for CI/CD tasks, because there is no need to install PyQt5 each
@@ -19,7 +108,6 @@ class TestStat():
 
         protocol = "https" if with_tls else "http"
         host = host.lower().replace(' ', '')
-        self.session = aiohttp.ClientSession()
         self.is_localhost = True if host == "127.0.0.1" or host == "localhost" else False
 
         if self.is_localhost and port.isdecimal():
@@ -34,175 +122,386 @@ class TestStat():
         else:
             throw_message(MessageEnum.CRITICAL, "Port Error", "Port cannot include characters!")
 
+        # A pool given by the caller is shared with other runs and is left
+        # open on close(), otherwise this instance gets a pool of its own.
+        self.owns_pool = pool is None
+        self.pool = ConnectionPool() if pool is None else pool
+
+        # Responses are recorded into or replayed from archive, if given
+        self.archive = archive
+
+        # Requests in flight by URL, shared by test cases querying the same URL
+        self.in_flight = {}
+        self.num_saved_requests = 0
+
+        # Responses of at least offload_threshold bytes are evaluated in a
+        # process pool, created on the first such response. 0 means never.
+        self.offload_threshold = offload_threshold
+        self.executor = None
+
+        # Requests that time out or get a 502 are tried up to retries more times
+        self.retry_policy = RetryPolicy(retries)
+
+        # Requests that straggle are sent once more if hedge, see HedgePolicy
+        self.hedge_policy = HedgePolicy() if hedge else None
+
+        # Deadlines per data call are derived from history if given, see
+        # LatencyHistory, otherwise configured in DATA_CALL_MAP
+        self.history = history
+        self._client_timeouts = {}
+
+    @property
+    def session(self):
+        return self.pool.session
+
+    async def close(self):
+
+        for task in self.in_flight.values():
+            task.cancel()
+
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+        if self.owns_pool:
+            await self.pool.close()
+
     async def run_test(
         self,
         data_call,
         test_input,
         expected_output,
         return_url=False,
-        return_data=False
+        return_data=False,
+        return_timing=False
     ):
+        """
+        Query data_call with test_input and evaluate the response against
+        expected_output, see evaluate_result. If return_data, the decoded
+        response is returned instead. return_url and return_timing append the
+        URL and the dict of seconds spent per phase (see TIMING_PHASES). If
+        the request was retried, the timing of each try is listed under
+        "attempts" of that dict. A test sharing the request of an identical
+        one in flight gets only the seconds it waited for it, as "shared".
+        """
+
+        # Archived responses are keyed by query, which is independent of the host
+        query = f"{data_call}/data.json?{test_input}"
+        url = f"{self.raw_query}{query}"
 
         if not self.is_localhost:
-            test_input += "&cache=ignore"
+            url += "&cache=ignore"
 
-        url = f"{self.raw_query}{data_call}/data.json?{test_input}"
+        start_time = time.perf_counter()
+        response, is_leader = await self._fetch_once(data_call, url, query)
 
-        timeout = aiohttp.ClientTimeout(total=15)
+        # Network phases are counted once, for the test that sent the request.
+        # The others sharing it only waited for it.
+        if is_leader:
+            timing = dict(response.timing)
+        else:
+            timing = {"shared": time.perf_counter() - start_time}
 
-        try:
-            async with self.session.get(url, timeout=timeout) as response:
-                actual_output = await response.json()
+        if len(response.attempts) > 1:
+            timing["attempts"] = response.attempts
 
-        except asyncio.TimeoutError:
-            if return_url:
-                return MessageEnum.TIMEOUT, url
-            return MessageEnum.TIMEOUT
+        # Timeout, bad gateway or connection error
+        if isinstance(response.body, int):
+            return _pack_result(response.body, url, timing, return_url, return_timing)
 
-        # In case of receiving non-JSON response
-        except aiohttp.ContentTypeError:
-            if return_url:
-                return MessageEnum.BAD_GATEWAY, url
-            return MessageEnum.BAD_GATEWAY
+        # Large responses are decoded and evaluated in another process, so that
+        # the event loop keeps serving the other requests meanwhile. Otherwise
+        # their time-out clocks keep ticking while the loop is blocked.
+        if not return_data and self.offload_threshold \
+                and len(response.body) >= self.offload_threshold:
 
-        except (aiohttp.ClientConnectorError, asyncio.CancelledError):
-            await self.session.close()
+            if not isinstance(expected_output, AssertionPlan):
+                expected_output = compile_plan(data_call, expected_output)
 
-            if return_url:
-                return MessageEnum.CONNECTION_ERROR, url
-            return MessageEnum.CONNECTION_ERROR
+            # Test cases sharing the response and the plan share its evaluation,
+            # whose seconds are counted once, for the test that started it
+            evaluation = response.evaluations.get(expected_output)
+            is_evaluator = evaluation is None
+
+            if is_evaluator:
+                evaluation = asyncio.ensure_future(
+                    self._evaluate_in_process(data_call, response.body, expected_output)
+                )
+                response.evaluations[expected_output] = evaluation
+
+            # Shielded, so that a cancelled caller does not cancel the others' evaluation
+            test_result, evaluation_timing = await asyncio.shield(evaluation)
+
+            if is_evaluator:
+                timing.update(evaluation_timing)
+
+            return _pack_result(test_result, url, timing, return_url, return_timing)
+
+        start_time = time.perf_counter()
+
+        try:
+            # Callers may alter the data they get, so each decodes a copy of its own
+            if return_data:
+                actual_output = json.loads(response.body)
+            else:
+                actual_output = response.decode()
+
+        except ValueError:
+            return _pack_result(MessageEnum.BAD_GATEWAY, url, timing, return_url, return_timing)
+
+        timing["decode"] = time.perf_counter() - start_time
 
         if return_data:
-            if return_url:
-                return actual_output, url
-            return actual_output
+            return _pack_result(actual_output, url, timing, return_url, return_timing)
+
+        start_time = time.perf_counter()
+
+        test_result = self.evaluate_result(
+            data_call,
+            actual_output,
+            expected_output,
+            response.indexes
+        )
+
+        timing["eval"] = time.perf_counter() - start_time
+
+        return _pack_result(test_result, url, timing, return_url, return_timing)
+
+    async def _evaluate_in_process(self, data_call, body, plan):
+        """Run evaluate_body in the process pool, created on first use"""
 
-        test_result = self.evaluate_result(data_call, actual_output, expected_output)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
 
-        if return_url:
-            return test_result, url
-        return test_result
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            evaluate_body,
+            data_call,
+            body,
+            plan
+        )
 
-    def evaluate_result(self, data_call, test_output, expected_output):
+    async def _fetch_once(self, data_call, url, query):
+        """
+        Fetch url unless an identical request is already in flight, in which
+        case wait for that one and share its response. Returns the response
+        and whether this call sent the request.
+        """
+
+        is_leader = url not in self.in_flight
+
+        if not is_leader:
+            self.num_saved_requests += 1
+        else:
+            task = asyncio.ensure_future(self._fetch_shared(data_call, url, query))
+            task.add_done_callback(lambda _: self.in_flight.pop(url, None))
+            self.in_flight[url] = task
+
+        # Shielded, so that a cancelled caller does not cancel the others' request
+        return await asyncio.shield(self.in_flight[url]), is_leader
+
+    async def _fetch_shared(self, data_call, url, query):
+        """Fetch url, retrying transient failures, see RetryPolicy"""
+
+        timing = {}
+        attempts = []
+
+        self.retry_policy.num_requests += 1
+
+        while True:
+            attempt_timing = {}
+            start_time = time.perf_counter()
+
+            body = await self._fetch_hedged(data_call, url, query, attempt_timing)
+
+            for phase, seconds in attempt_timing.items():
+                timing[phase] = timing.get(phase, 0) + seconds
+
+            attempts.append({
+                **attempt_timing,
+                "seconds": time.perf_counter() - start_time,
+                "error": body if isinstance(body, int) else None
+            })
+
+            # Replayed responses are the same on every try
+            if self.archive is not None and self.archive.replay:
+                break
+
+            delay = self.retry_policy.get_delay(len(attempts), body)
+            if delay is None:
+                break
+
+            await asyncio.sleep(delay)
+            timing["backoff"] = timing.get("backoff", 0) + delay
+
+        return SharedResponse(body, timing, attempts)
+
+    async def _fetch_hedged(self, data_call, url, query, timing):
+        """
+        Fetch url, and fetch it once more if it is not answered within the
+        hedge delay of data_call, see HedgePolicy. The first successful answer
+        wins and the other request is cancelled, whereas an error of one
+        request leaves the other to answer. If both fail, the error of the
+        original request is returned. timing is that of the winner.
+        """
+
+        if self.hedge_policy is None or (self.archive is not None and self.archive.replay):
+            return await self._fetch(data_call, url, query, timing)
+
+        self.hedge_policy.num_requests += 1
+        delay = self.hedge_policy.get_delay(data_call)
+
+        start_time = time.perf_counter()
+        timings = {}
+        tasks = []
+
+        def _start_request():
+            request_timing = {}
+            task = asyncio.ensure_future(self._fetch(data_call, url, query, request_timing))
+            timings[task] = request_timing
+            tasks.append(task)
+
+        try:
+            _start_request()
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+
+            if not done and self.hedge_policy.acquire():
+                _start_request()
+
+            winner = None
+            pending = tasks
+
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                # The original request wins a tie
+                winner = next(
+                    (task for task in tasks if task in done and not isinstance(task.result(), int)),
+                    None
+                )
+
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        if winner is None:
+            winner = tasks[0]
+
+        body = winner.result()
+
+        if winner is not tasks[0]:
+            self.hedge_policy.num_hedge_wins += 1
+
+        timing.update(timings[winner])
+
+        if not isinstance(body, int):
+            self.hedge_policy.record(data_call, time.perf_counter() - start_time)
+
+        return body
+
+    def _get_client_timeout(self, data_call):
+
+        client_timeout = self._client_timeouts.get(data_call)
+
+        if client_timeout is None:
+            if self.history is not None:
+                timeout = self.history.get_timeout(data_call)
+            else:
+                timeout = get_timeout(data_call)
+
+            client_timeout = aiohttp.ClientTimeout(
+                total=timeout.get("total"),
+                sock_connect=timeout.get("connect"),
+                sock_read=timeout.get("read")
+            )
+            self._client_timeouts[data_call] = client_timeout
+
+        return client_timeout
+
+    async def _fetch(self, data_call, url, query, timing):
+        """
+        Return raw response body of url, or MessageEnum code on failure. The
+        seconds spent in each network phase are added into timing.
+        """
+
+        if self.archive is not None and self.archive.replay:
+            record = self.archive.get(query)
+
+            if record is None:
+                return MessageEnum.NOT_RECORDED
+            if record["error"]:
+                return record["error"]
+            return record["body"].encode("utf-8")
+
+        timeout = self._get_client_timeout(data_call)
+        start_time = time.perf_counter()
+
+        try:
+            async with self.session.get(
+                url,
+                timeout=timeout,
+                trace_request_ctx=timing
+            ) as response:
+
+                transfer_start_time = time.perf_counter()
+                body = await response.read()
+                timing["transfer"] = time.perf_counter() - transfer_start_time
+
+                # In case of receiving non-JSON response
+                if not JSON_CONTENT_TYPE.match(response.content_type):
+                    error = MessageEnum.BAD_GATEWAY
+                else:
+                    error = None
+
+                if self.archive is not None:
+                    self.archive.record(
+                        query,
+                        url,
+                        response.status,
+                        dict(response.headers),
+                        time.perf_counter() - start_time,
+                        body,
+                        error
+                    )
+
+                return error or body
+
+        except asyncio.TimeoutError:
+            error = MessageEnum.TIMEOUT
+
+        except aiohttp.ClientConnectorError:
+            # The pool is shared by the other requests in flight, so it is kept
+            # open. A connection that could not be established is not pooled.
+            return MessageEnum.CONNECTION_ERROR
+
+        # Timeouts are recorded as well, so that a replay reproduces them
+        if self.archive is not None:
+            self.archive.record(query, url, None, {}, time.perf_counter() - start_time, None, error)
+
+        return error
+
+    @staticmethod
+    def evaluate_result(data_call, test_output, expected_output, indexes=None):
         """
         Evaluate test result by comparing expected_output with test_output
-        for given data_call. Returns:
+        for given data_call. expected_output is either a dict of expected
+        values or an AssertionPlan compiled from such. indexes keeps the
+        indexes built on test_output, see execute_plan. Returns:
             {}  -> test is successful
             int -> test could not be executed (connection error, timeout)
             {param: val} -> test output that does not match with expected
         """
 
-        def _apply_flag(flag, param_set, param, output_value):
-            """
-            Returns True if expected value (param_set[param]) is compatible
-            with output_value based on given flag. Otherwise returns False.
-            """
-
-            if flag == TRIM_AS:
-                if param_set[param].startswith('as'):
-                    param_set[param] = param_set[param][2:]
-
-            elif flag == NOT_EMPTY:
-                return param_set[param] == "notempty" and output_value
-
-            elif flag == INCLUDE:
-                return all([val in output_value for val in param_set[param].split(',')])
-
-            elif flag == INCLUDE_KEYS:
-                return all([val in output_value.keys() for val in param_set[param].split(',')])
-
-            elif flag == MATCH:
-                return param_set[param] == output_value
-
-            elif flag == COMPARE:
-                if ">=" in param_set[param]:
-                    expected_value = float(param_set[param].split(">=")[1])
-                    return float(output_value) >= expected_value
-
-                elif ">" in param_set[param]:
-                    expected_value = float(param_set[param].split(">")[1])
-                    return float(output_value) > expected_value
-
-                elif "<=" in param_set[param]:
-                    expected_value = float(param_set[param].split("<=")[1])
-                    return float(output_value) <= expected_value
-
-                elif "<" in param_set[param]:
-                    expected_value = float(param_set[param].split("<")[1])
-                    return float(output_value) < expected_value
-
-        def _check_current_level(current_level, current_identifier):
-            """
-            Check if all block fields match with the comparison rule
-            from top to bottom node, level by level and populates the list
-            resulting_bools with evaluation results.
-            """
-
-            for field in current_level:
-
-                if not isinstance(current_level[field], dict):
-
-                    # Get the output value from the data call response block
-                    if "->" in current_identifier:
-                        current_identifier_short = "->".join(
-                            current_identifier.split("->")[1:] + [field]
-                        )
-                        output_value = get_innermost_value(current_identifier_short, block)
-                    else:
-                        output_value = get_innermost_value(field, block)
-
-                    # Checking for the "notempty" flag or the output and
-                    # expected parameters "notempty" could be applied to a
-                    # nested parameter, such as "prefix->timelines". In this
-                    # case the output_value is a list. Alternatively, notempty
-                    # could be applied to a non-nested parameter. In this case
-                    # the output_value is a string to satisfy the possibilities
-                    # above, the length of the output_value is checked.
-                    if current_level[field] == "notempty":
-                        if len(output_value) > 0:
-                            resulting_bools.append(True)
-                        else:
-                            resulting_bools.append(False)
-                    else:
-                        field_flags = get_innermost_value(
-                            f"{current_identifier}->{field}",
-                            DATA_CALL_MAP[data_call]["output_params"]
-                        )
-                        field_flags = field_flags.copy()
-
-                        rule = field_flags.pop(0)
-
-                        if "->" in current_identifier:
-                            expected = fields[current_identifier_short.split("->")[0]]
-                        else:
-                            expected = fields
-
-                        # Apply filters before ANY/ALL if there are such
-                        while rule not in [ANY, ALL]:
-                            _apply_flag(rule, expected, field, output_value)
-                            rule = param_flags.pop(0)
-
-                        bools = [
-                            _apply_flag(flag, expected, field, output_value) for flag in field_flags
-                        ]
-
-                        if rule == ANY:
-                            resulting_bools.append(any(bools))
-                        elif rule == ALL:
-                            resulting_bools.append(all(bools))
-
-                        if not all(resulting_bools):
-                            break
-                else:
-                    _check_current_level(current_level[field], f"{current_identifier}->{field}")
+        if isinstance(expected_output, AssertionPlan):
+            plan = expected_output
+        else:
+            plan = compile_plan(data_call, expected_output)
 
         failed_params = {}
 
-        # Nested parameters should be treated differently
-        nested_params = {}
-
         # If status code is different than expected, directly return
-        expected_status_code = expected_output["status_code"]
+        expected_status_code = plan.status_code
         if expected_status_code == "500" != str(test_output["status_code"]):
             return failed_params
 
@@ -218,89 +517,15 @@ class TestStat():
                     failed_params["error"] = message[1].split("\n")[0]
             return failed_params
 
-        expected_output.pop("status_code")
+        data = test_output["data"]
 
         # In some data call responses, 'data' is wrapped with 'results' key.
-        # Extract this key if in such case.
-        if "results" in test_output["data"]:
-            for key, value in test_output["data"]["results"].items():
-                test_output["data"][key] = value
-
-            del test_output["data"]["results"]
-
-        # Make all items of test_output["data"] lower case, trim whitespaces
-        # and convert bools&numbers into string representations.
-        test_output["data"] = filter_param_set(test_output["data"].copy())
-
-        for param, value in expected_output.items():
-
-            if param.split("->")[0] not in test_output["data"]:
-                failed_params[param] = "The output does not include this key!"
-                continue
-
-            # Seperate nested parameters from regular parameters
-            if param.split("->")[0] in ParamsCommons.NESTED_PARAMS:
-                nested_params[param] = value
-                continue
-
-            test_output_value = get_innermost_value(param, test_output["data"])
-            param_flags = get_innermost_value(param, DATA_CALL_MAP[data_call]["output_params"])
-            param_flags = param_flags.copy()
-            rule = param_flags.pop(0)
-
-            # Apply filters before ANY/ALL if there are such
-            while rule not in [ANY, ALL]:
-                _apply_flag(rule, expected_output, param, test_output_value)
-                rule = param_flags.pop(0)
-
-            resulting_bools = [
-                _apply_flag(flag, expected_output, param, test_output_value) for flag in param_flags
-            ]
-
-            if (rule == ANY and any(resulting_bools)) or (rule == ALL and all(resulting_bools)):
-                continue
-
-            failed_params[param] = test_output_value
-
-        # After dealing with all regular parameters, nested parameters are
-        # evaluated below. The following evaluation is based on the highest
-        # nested parameter in the hierarchy.
-        # Example: prefixes->timelines->startdate the nested param is prefixes
-        for nested_param, fields in reshape_param_set(nested_params).items():
-
-            # If a checkbox "Not Empty" is checked for a nested parameter,
-            # check if the corresponding response list of parameter is empty
-            if fields == "notempty":
-                if not test_output["data"][nested_param]:
-                    failed_params[nested_param] = []
-                continue
-
-            is_match = False
-            resulting_bools = []
-
-            # Check if there is a block in test_output["data"][nested_param]
-            # that match with all fields of the same nested_param (expected)
-            for block in test_output["data"][nested_param]:
-
-                # Jump to next block if current one does not include all fields
-                if not all([field in block for field in fields]):
-                    continue
-
-                # At this point, current block includes all the fields in the
-                # corresponding fields of the nested parameter. Then, check if
-                # all those block fields match with the comparison rule.
-                # The function below populates the list resulting_bools.
-                _check_current_level(fields, nested_param)
-
-                # If resulting_bools is consist of True bools only, this means
-                # we have a match, therefore the test case is successful.
-                if all(resulting_bools):
-                    is_match = True
-                    break
-                else:
-                    resulting_bools.clear()
-
-            if not is_match:
-                failed_params[nested_param] = "No item matching all the expected inputs found!"
-
-        return failed_params
+        # Extract this key if in such case. Only the top level is copied.
+        if "results" in data:
+            data = {**data, **data["results"]}
+            del data["results"]
+
+        # Items of data are compared in lower case, without whitespaces and
+        # with bools&numbers in string representations. This normalization
+        # is applied only along the paths the expected output refers to.
+        return execute_plan(plan, data, indexes)
@@ -1,18 +1,23 @@
 import csv
 import json
+import asyncio
 import random as rand
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import requests
 
-from core.config import MATTERMOST_CHANNEL, MATTERMOST_URL
+from core.model import TestCase
+from core.suite import TestSuite
+from core.config import MATTERMOST_CHANNEL, MATTERMOST_URL, SUITE_EXTENSION, TIMING_PHASES
 
 
 MATTERMOST_NEWLINE = "` `  "
 MATTERMOST_TABLE_FRAME = (
-    "| Data Call | Tests | Failures | Timeouts | Failed & Timed-out URLs |\n"
-    "|:----------|:-----:|:--------:|:--------:|:------------------------|\n"
+    "| Data Call | Tests | Failures | Timeouts | p50 (ms) | p90 (ms) | p99 (ms) | Max (ms) "
+    "| Failed & Timed-out URLs |\n"
+    "|:----------|:-----:|:--------:|:--------:|---------:|---------:|---------:|---------:"
+    "|:------------------------|\n"
 )
 
 
@@ -20,6 +25,7 @@ class MessageEnum():
 
     NO = 65536
     YES = 16384
+    NOT_RECORDED = 404
     TIMEOUT = 408
     CONNECTION_ERROR = 500
     BAD_GATEWAY = 502
@@ -46,86 +52,6 @@ def get_innermost_value(param, param_set):
     return inner_param_value
 
 
-def filter_param_set(param_set, filtered_param_set={}, current_level=None):
-    """
-    Make all parameter-value pairs of param_set lower case, trims whitespaces,
-    convert bools&numbers into string representations.
-    """
-
-    def _f(input):
-        return input.lower().replace(' ', '')
-
-    for param, value in param_set.items():
-
-        if isinstance(value, str):
-            if current_level:
-                filtered_param_set[current_level][_f(param)] = _f(value)
-            else:
-                filtered_param_set[_f(param)] = _f(value)
-
-        # Bools should be checked first, since Boolean is a subclass of int,
-        # any bool variable matches with the following isinstance too.
-        elif isinstance(value, bool):
-            if current_level:
-                filtered_param_set[current_level][_f(param)] = "true" if value else "false"
-            else:
-                filtered_param_set[_f(param)] = "true" if value else "false"
-
-        elif isinstance(value, (int, float)):
-            if current_level:
-                filtered_param_set[current_level][_f(param)] = str(value)
-            else:
-                filtered_param_set[_f(param)] = str(value)
-
-        elif value is None:
-            if current_level:
-                filtered_param_set[current_level][_f(param)] = "none"
-            else:
-                filtered_param_set[_f(param)] = "none"
-
-        elif isinstance(value, list):
-            new_value = []
-
-            for list_item in value:
-
-                if isinstance(list_item, str):
-                    new_value.append(_f(list_item))
-
-                elif isinstance(list_item, bool) and list_item:
-                    new_value.append("true")
-
-                elif isinstance(list_item, bool):
-                    new_value.append("false")
-
-                elif isinstance(list_item, (int, float)):
-                    new_value.append(str(list_item))
-
-                elif list_item is None:
-                    new_value.append("none")
-
-                elif isinstance(list_item, list):
-                    new_list_item = []
-
-                    for inner_item in list_item:
-                        new_list_item.append(filter_param_set(inner_item, {}))
-
-                    new_value.append(new_list_item)
-
-                else:
-                    new_value.append(filter_param_set(list_item, {}))
-
-            if current_level:
-                filtered_param_set[current_level][_f(param)] = new_value
-            else:
-                filtered_param_set[_f(param)] = new_value
-
-        else:
-            filtered_param_set[param] = {}
-            filtered_param_set = filter_param_set(value, filtered_param_set, param)
-
-    return filtered_param_set
-
-
 def reshape_param_set(param_set):
     """
     param_set:
@@ -178,6 +104,18 @@ def reshape_param_set(param_set):
     return reshaped_param_set
 
 
+def format_timing(timing):
+    """Format seconds spent per phase, e.g. 'dns: 2.1 ms | ttfb: 310.4 ms'"""
+
+    if not timing:
+        return "No phase completed"
+
+    return " | ".join(
+        f"{phase}: {timing[phase] * 1000:.1f} ms"
+        for phase in TIMING_PHASES if phase in timing
+    )
+
+
 def compare_output_equality(comparison_fields, *outputs):
     """
     Compare test outputs and return True if all have the same status code and data.
@@ -238,23 +176,11 @@ def process_stats(stats, sort_by="count"):
 
     processed_stats = {}
 
-    for tuple in stats["failure"]:
-        if tuple.data_call not in processed_stats:
-            processed_stats[tuple.data_call] = {
-                "failed_queries": [tuple.url],
-                "timed_out_queries": []
-            }
-        else:
-            processed_stats[tuple.data_call]["failed_queries"].append(tuple.url)
-
-    for tuple in stats["time_out"]:
-        if tuple.data_call not in processed_stats:
-            processed_stats[tuple.data_call] = {
-                "failed_queries": [],
-                "timed_out_queries": [tuple.url]
-            }
-        else:
-            processed_stats[tuple.data_call]["timed_out_queries"].append(tuple.url)
+    for data_call in set(stats["failed_queries"]) | set(stats["timed_out_queries"]):
+        processed_stats[data_call] = {
+            "failed_queries": list(stats["failed_queries"].get(data_call, [])),
+            "timed_out_queries": list(stats["timed_out_queries"].get(data_call, []))
+        }
 
     if sort_by == "count":
         # Sort data calls in reverse order, prioritize failures over time-outs
@@ -274,13 +200,44 @@ def process_stats(stats, sort_by="count"):
     return {data_call: processed_stats[data_call] for data_call in data_calls_in_order}
 
 
-def get_batch(iterable, batch_size):
-    """Slice iterable and return batches of batch_size each time"""
+async def run_in_window(routines, window_size):
+    """
+    Run given coroutines while keeping at most window_size of them in flight.
+    Unlike running them in batches, the next coroutine is started as soon as
+    any running one completes, so a slow query holds up only its own slot.
+    Yield the result of each coroutine in order of completion.
+
+    window_size may also be a function returning the current size, e.g. a
+    ConcurrencyLimit, which is read whenever the window is topped up.
+    """
+
+    get_window_size = window_size if callable(window_size) else lambda: window_size
+
+    routines = iter(routines)
+    in_flight = set()
 
-    total_length = len(iterable)
+    try:
+        while True:
 
-    for index in range(0, total_length, batch_size):
-        yield iterable[index:min(index + batch_size, total_length)]
+            # Top the window up; routines is consumed lazily
+            if len(in_flight) < get_window_size():
+                for routine in routines:
+                    in_flight.add(asyncio.ensure_future(routine))
+                    if len(in_flight) >= get_window_size():
+                        break
+
+            if not in_flight:
+                return
+
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                yield task.result()
+
+    finally:
+        # Cancel whatever is still running if the consumer stops early
+        for task in in_flight:
+            task.cancel()
 
 
 def get_dc_version_map(preferred_data_calls):
@@ -298,11 +255,34 @@ def get_dc_version_map(preferred_data_calls):
 
 def parse_csv(csv_path, preferred_data_calls=None, random=None):
     """
-    Parse given CSV file and return test cases for all/requested data calls
+    Parse given CSV file or compiled suite file and yield TestCase objects
+    for all/requested data calls, numbered in the order they are yielded.
+    Files are read test case by test case.
     If random is given, sample a specific number of test cases per data call
-    (implemented only for full run without any data call preference)
+    (implemented only for full run without any data call preference). The
+    samples are kept in a reservoir per data call and yielded at the end.
+    Malformed rows are skipped, and their number is the return value of the
+    generator, e.g. of `yield from parse_csv(...)`. Compiled suite files do
+    not include any.
     """
 
+    if csv_path.endswith(SUITE_EXTENSION):
+        yield from _parse_suite(csv_path, preferred_data_calls, random)
+        return 0
+
+    num_skipped = 0
+
+    def _parse_rows(csv_reader):
+        nonlocal num_skipped
+
+        for row_index, row in enumerate(csv_reader, 1):
+            test_case = TestCase.from_row(row_index, row)
+
+            if test_case is None:
+                num_skipped += 1
+            else:
+                yield test_case
+
     with open(csv_path) as csv_file:
 
         csv_reader = csv.reader(csv_file, delimiter=',')
@@ -315,35 +295,116 @@ def parse_csv(csv_path, preferred_data_calls=None, random=None):
         if preferred_data_calls:
             dc_version_map = get_dc_version_map(preferred_data_calls)
 
-            csv_reader = filter(lambda row: row[0] in dc_version_map, list(csv_reader))
+            csv_reader = (row for row in csv_reader if row and row[0] in dc_version_map)
 
-            test_cases = []
+            yield from _select_versions(_parse_rows(csv_reader), dc_version_map)
 
-            for row_index, row in enumerate(csv_reader, 1):
+        elif not random:
+            yield from _parse_rows(csv_reader)
 
-                # If there is no specific version requested
-                if not dc_version_map[row[0]]:
-                    test_cases.append((row_index, row, None))
+        else:
+            # Reservoir sampling: the n-th test of a data call replaces a random
+            # sample with probability random/n, so that each test ends up in
+            # the samples with the same probability.
+            samples_per_dc = {}
+            tests_per_dc = defaultdict(int)
+
+            for test_case in _parse_rows(csv_reader):
+                samples = samples_per_dc.setdefault(test_case.data_call, [])
+                tests_per_dc[test_case.data_call] += 1
+
+                if len(samples) < random:
+                    samples.append(test_case)
                 else:
-                    for version in dc_version_map[row[0]]:
-                        test_cases.append((row_index, row, version))
+                    index = rand.randrange(tests_per_dc[test_case.data_call])
+                    if index < random:
+                        samples[index] = test_case
+
+            samples = (test_case for samples in samples_per_dc.values() for test_case in samples)
+
+            for row_index, test_case in enumerate(samples, 1):
+                yield test_case.renumber(row_index)
+
+    return num_skipped
+
+
+def _select_versions(test_cases, dc_version_map):
+    """Renumber test_cases and yield each once per version requested in dc_version_map"""
+
+    for row_index, test_case in enumerate(test_cases, 1):
+
+        # If there is no specific version requested
+        if not dc_version_map[test_case.data_call]:
+            yield test_case.renumber(row_index)
         else:
-            if not random:
-                test_cases = [(row[0], row[1], None) for row in list(enumerate(csv_reader, 1))]
-            else:
-                test_cases = []
-                test_cases_per_dc = defaultdict(list)
-
-                for row in list(csv_reader):
-                    test_cases_per_dc[row[0]].append(row)
-
-                for tests in test_cases_per_dc.values():
-                    if len(tests) <= random:
-                        for test in tests:
-                            test_cases.append((len(test_cases) + 1, test, None))
-                    else:
-                        random_tests = rand.sample(tests, random)
-                        for test in random_tests:
-                            test_cases.append((len(test_cases) + 1, test, None))
+            for version in dc_version_map[test_case.data_call]:
+                yield test_case.renumber(row_index, version)
+
+
+def _parse_suite(suite_path, preferred_data_calls=None, random=None):
+    """
+    parse_csv for compiled suite files. Test cases of the preferred data
+    calls are looked up through the index of the suite, and samples are
+    drawn from the index, so the other test cases are never read.
+    """
+
+    test_suite = TestSuite(suite_path)
+
+    try:
+        if preferred_data_calls:
+            dc_version_map = get_dc_version_map(preferred_data_calls)
+
+            test_cases = test_suite.iter_data_calls(list(dc_version_map))
+
+            yield from _select_versions(test_cases, dc_version_map)
+
+        elif not random:
+            yield from test_suite
+
+        else:
+            row_index = 0
+
+            for data_call in test_suite.index:
+                offsets = test_suite.get_offsets(data_call)
+
+                if len(offsets) > random:
+                    offsets = rand.sample(offsets, random)
+
+                for offset in offsets:
+                    row_index += 1
+                    yield test_suite.read(offset).renumber(row_index)
+
+    finally:
+        test_suite.close()
+
+
+def order_test_cases(test_cases, history=None, interleave=False):
+    """
+    Return test_cases in the order to run them. If history is given, the
+    longest expected first (LPT scheduling), see LatencyHistory, so that the
+    run does not end waiting on a few slow tests started last. If interleave,
+    data calls take turns, each with its next test in that order, so that no
+    single backend gets all the requests at once.
+    """
+
+    test_cases = list(test_cases)
+
+    if history is not None:
+        test_cases.sort(key=history.get_expected_duration, reverse=True)
+
+    if interleave:
+        # Data calls take turns in the order of their first test
+        queues = {}
+        for test_case in test_cases:
+            queues.setdefault(test_case.data_call, deque()).append(test_case)
+
+        queues = list(queues.values())
+        test_cases = []
+
+        while queues:
+            for queue in queues:
+                test_cases.append(queue.popleft())
+
+            queues = [queue for queue in queues if queue]
 
     return test_cases
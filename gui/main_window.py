@@ -1,18 +1,20 @@
 import csv
 import os
-import asyncio
 
-from core.teststat import TestStat
+from core.config import SUITE_EXTENSION, GUI_FRAME_INTERVAL, GUI_SEARCH_DELAY, GUI_INDEX_CHUNK
+from core.model import TestResult
+from core.suite import TestSuite, compile_suite
 from core.utils import MessageEnum
-from gui.utils import ReadOnlyDelegator, ColorEnum, StyleEnum, throw_message, \
-    format_table_item, HOSTS
+from gui.utils import StyleEnum, throw_message, format_table_item, HOSTS
 from gui.test_case_window import TestCaseWindow
+from gui.runner import TestRunner
+from gui.test_suite_model import TestSuiteModel, FAILED_SECOND_HOST
 
-from PyQt5.QtCore import Qt, QRect
-from PyQt5.QtGui import QFont, QColor
+from PyQt5.QtCore import Qt, QRect, QTimer
+from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QGridLayout, \
-    QLabel, QPushButton, QComboBox, QTableWidget, QTableWidgetItem, \
-    QProgressBar, QLineEdit, QApplication, QDialog, QCheckBox, QHeaderView
+    QLabel, QPushButton, QComboBox, QTableView, QProgressBar, QLineEdit, \
+    QApplication, QDialog, QCheckBox, QHeaderView
 
 
 class MainWindow(QWidget):
@@ -29,11 +31,45 @@ class MainWindow(QWidget):
         # Active test results on the table
         self.previous_results = False
 
-        # Default path of test cases
+        # Default path of test cases, and of the CSV file they are saved to,
+        # which is the source of a compiled suite
         self.test_cases_path = "data/test_cases_500.csv"
-
-        # Early-stopping
-        self.stop = False
+        self.test_cases_csv_path = self.test_cases_path
+
+        # Tests run on a worker thread, which sends their results in batches
+        self.runner = TestRunner()
+        self.runner.results_ready.connect(self.buffer_test_results)
+        self.runner.run_finished.connect(self.on_run_finished)
+
+        # Passed, failed and timed-out tests of the current run
+        self.num_passed_tests = 0
+        self.num_failed_tests = 0
+        self.num_timed_out_tests = 0
+
+        # Results received but not shown yet. They are shown together at most
+        # once per GUI_FRAME_INTERVAL, however many batches arrive meanwhile.
+        self.pending_results = []
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.setInterval(int(GUI_FRAME_INTERVAL * 1000))
+        self.frame_timer.timeout.connect(self.apply_test_results)
+
+        # Main and second host of the comparison in progress, if any, see
+        # on_btn_compare_sources_click
+        self.compared_hosts = None
+
+        # Rows of the table whose heights fit their contents, see resize_rows
+        self.fitted_rows = bytearray()
+
+        # Searches run once typing pauses, see update_table_test_suite
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(int(GUI_SEARCH_DELAY * 1000))
+        self.search_timer.timeout.connect(self.update_table_test_suite)
+
+        # Loaded tests are indexed for search in chunks between events
+        self.index_timer = QTimer(self)
+        self.index_timer.timeout.connect(self.index_test_suite)
 
     def setup_ui(self):
         """Set the main window up"""
@@ -53,25 +89,24 @@ class MainWindow(QWidget):
         font.setBold(True)
         font.setPointSize(16)
 
-        # Test cases table
-        self.table_test_suite = QTableWidget(0, 5)
+        # Test cases table, whose cells are served by the model
+        self.test_suite_model = TestSuiteModel(font)
+        self.test_suite_model.dataChanged.connect(lambda *_: self.count_selected_tests())
+        self.test_suite_model.modelReset.connect(self.count_selected_tests)
+
+        self.table_test_suite = QTableView()
+        self.table_test_suite.setModel(self.test_suite_model)
         self.table_test_suite.setGeometry(QRect(50, 200, 1190, 470))
         self.table_test_suite.setColumnWidth(0, 20)
-        self.table_test_suite.itemChanged.connect(self.count_selected_tests)
         header = self.table_test_suite.horizontalHeader()
 
         for index in range(1, 5):
             header.setSectionResizeMode(index, QHeaderView.Stretch)
 
-        for index, col in enumerate(["", "Data Call", "Test Input", "Expected Output", "Output"]):
-            item = QTableWidgetItem(col)
-            item.setFont(font)
-            self.table_test_suite.setHorizontalHeaderItem(index, item)
-
-        # Make column 1 and 4 read-only
-        delegator = ReadOnlyDelegator(self.table_test_suite)
-        self.table_test_suite.setItemDelegateForColumn(1, delegator)
-        self.table_test_suite.setItemDelegateForColumn(3, delegator)
+        # Heights of rows are fitted as they are scrolled into view
+        scrollbar = self.table_test_suite.verticalScrollBar()
+        scrollbar.valueChanged.connect(self.fit_visible_rows)
+        scrollbar.rangeChanged.connect(self.fit_visible_rows)
 
         # Labels
         label_host = QLabel("Source:")
@@ -80,7 +115,7 @@ class MainWindow(QWidget):
         label_passed = QLabel("Passed:")
         label_failed = QLabel("Failed:")
         label_timeout = QLabel("Timed-out:")
-        self.label_total_value = QLabel(f"{self.table_test_suite.rowCount()}")
+        self.label_total_value = QLabel(f"{self.test_suite_model.num_tests}")
         self.label_selected_value = QLabel("0")
         self.label_passed_value = QLabel("0")
         self.label_failed_value = QLabel("0")
@@ -113,6 +148,17 @@ class MainWindow(QWidget):
             clicked=lambda: self.reset_main_window(clear_tests=False, confirmation=False)
         )
 
+        # Disabled while tests are running, since they alter or reorder the rows
+        self.run_controls = [
+            btn_run,
+            btn_compare,
+            btn_new_test,
+            btn_remove_test,
+            btn_load_test,
+            btn_save_test,
+            btn_clear_outputs
+        ]
+
         # Checkboxes
         self.checkbox_select_all = QCheckBox(
             "Select All",
@@ -129,10 +175,10 @@ class MainWindow(QWidget):
         )
 
         # # Line Edits
-        searchbar = QLineEdit()
-        searchbar.setMaximumWidth(245)
-        searchbar.setPlaceholderText("Search Data Call")
-        searchbar.textChanged.connect(self.update_table_test_suite)
+        self.searchbar = QLineEdit()
+        self.searchbar.setMaximumWidth(245)
+        self.searchbar.setPlaceholderText("Search Tests")
+        self.searchbar.textChanged.connect(lambda: self.search_timer.start())
 
         self.port = QLineEdit("8000")
         self.port.setPlaceholderText("Port")
@@ -146,7 +192,7 @@ class MainWindow(QWidget):
         self.progressbar.hide()
 
         # Wrap the test case window UI up
-        for item in [self.table_test_suite, searchbar, self.port]:
+        for item in [self.table_test_suite, self.searchbar, self.port]:
             item.setStyleSheet(StyleEnum.TABLE_LINE_EDIT)
 
         for item in [
@@ -209,7 +255,7 @@ class MainWindow(QWidget):
         top_layout.addLayout(top_right_layout, 3)
 
         middle_top_layout.addWidget(self.checkbox_select_all)
-        middle_top_layout.addWidget(searchbar)
+        middle_top_layout.addWidget(self.searchbar)
         middle_top_layout.addStretch()
         middle_layout.addLayout(middle_top_layout)
         middle_layout.addWidget(self.table_test_suite)
@@ -225,40 +271,76 @@ class MainWindow(QWidget):
 
         self.setLayout(outer_layout)
 
+    def closeEvent(self, event):
+        """Close pooled connections along with the window"""
+
+        self.runner.close()
+
+        super().closeEvent(event)
+
     # Utilization methods
-    def count_selected_tests(self, item):
-        """Check whether change occured in the 1st column (checkbox)"""
+    def count_selected_tests(self):
+        """Show the number of checked tests, which the model keeps count of"""
 
-        if item.column() == 0:
-            if self.table_test_suite.item(item.row(), 0) is not None:
-                self.label_selected_value.setText(
-                    f"{len(self.get_checked_row_indexes(return_all = False))}"
-                )
+        self.label_selected_value.setText(f"{self.test_suite_model.num_checked}")
 
-    def update_table_test_suite(self, text):
+    def update_table_test_suite(self):
         """
-        Dynamically update the table with tests corresponding to the string in
-        the searchbar. Set the "Select All" checkbox unchecked with any change
-        in search string, so any resulting tests can be selected in bulk.
+        Show only the tests whose data call, test input or expected output
+        include the string in the searchbar, looked up in the search index of
+        the model. Set the "Select All" checkbox unchecked with any change in
+        search string, so any resulting tests can be selected in bulk.
         """
 
         self.checkbox_select_all.setChecked(False)
 
-        for row in range(self.table_test_suite.rowCount()):
-            if text.lower() in self.table_test_suite.item(row, 1).text():
-                self.table_test_suite.showRow(row)
-            else:
-                self.table_test_suite.hideRow(row)
+        text = self.searchbar.text()
+        self.test_suite_model.set_search_rows(self.test_suite_model.search(text) if text else None)
 
-    def colorize_table_row(self, row_index, text_color, background_color, process_immediately=True):
-        """Colorize given row's background and text"""
+        self.resize_rows()
 
-        for col_index in range(self.table_test_suite.columnCount()):
-            self.table_test_suite.item(row_index, col_index).setForeground(QColor(text_color))
-            self.table_test_suite.item(row_index, col_index).setBackground(QColor(background_color))
+    def index_test_suite(self):
+        """Index the next chunk of tests for search, until all are indexed"""
 
-        if process_immediately:
-            QApplication.processEvents()
+        if self.test_suite_model.index_rows(GUI_INDEX_CHUNK):
+            self.index_timer.stop()
+
+    def resize_rows(self, rows=None):
+        """
+        Fit the heights of given rows of the model, all by default, to their
+        contents. Rows are measured only once they are within the viewport,
+        see fit_visible_rows, so this does not grow with the size of the table.
+        """
+
+        if rows is None or len(self.fitted_rows) != self.test_suite_model.rowCount():
+            self.fitted_rows = bytearray(self.test_suite_model.rowCount())
+        else:
+            for view_row in self.test_suite_model.get_view_rows(rows):
+                self.fitted_rows[view_row] = 0
+
+        self.fit_visible_rows()
+
+    def fit_visible_rows(self):
+        """Fit the heights of rows within the viewport, which are not fitted yet"""
+
+        if len(self.fitted_rows) != self.test_suite_model.rowCount():
+            self.fitted_rows = bytearray(self.test_suite_model.rowCount())
+
+        row = self.table_test_suite.rowAt(0)
+        if row < 0:
+            return
+
+        viewport_height = self.table_test_suite.viewport().height()
+
+        # Fitting a row moves the rows below it, so positions are read as it goes
+        while row < len(self.fitted_rows) and \
+                self.table_test_suite.rowViewportPosition(row) < viewport_height:
+
+            if not self.fitted_rows[row]:
+                self.table_test_suite.resizeRowToContents(row)
+                self.fitted_rows[row] = 1
+
+            row += 1
 
     def reset_main_window(self, clear_tests=False, confirmation=True, clear_checkboxes=True):
 
@@ -274,7 +356,7 @@ class MainWindow(QWidget):
         self.previous_results = False
 
         # Restore the status labels
-        self.label_total_value.setText(f"{self.table_test_suite.rowCount()}")
+        self.label_total_value.setText(f"{self.test_suite_model.num_tests}")
         for item in [self.label_passed_value, self.label_failed_value, self.label_timed_out_value]:
             item.setText("0")
             item.setStyleSheet(StyleEnum.UI)
@@ -284,30 +366,21 @@ class MainWindow(QWidget):
         self.progressbar.hide()
 
         if clear_tests:
-            self.table_test_suite.clearContents()
-            self.table_test_suite.setRowCount(0)
+            self.test_suite_model.set_rows([])
             self.label_total_value.setText("0")
             QApplication.processEvents()
             return
 
         self.checkbox_select_all.setChecked(False)
 
-        for row_index in range(self.table_test_suite.rowCount()):
-
-            self.colorize_table_row(row_index, ColorEnum.UI_FONT, ColorEnum.WHITE, False)
+        # Clear test outputs and colors in each row
+        self.test_suite_model.clear_results()
 
-            # Clear test outputs in each row
-            self.table_test_suite.item(
-                row_index,
-                self.table_test_suite.columnCount() - 1
-            ).setText('')
+        if clear_checkboxes:
+            self.test_suite_model.set_checked(self.test_suite_model.get_checked_rows(), False)
 
-            if clear_checkboxes:
-                checkbox = self.table_test_suite.item(row_index, 0)
-                if checkbox.checkState() == Qt.Checked:
-                    checkbox.setCheckState(Qt.Unchecked)
-
-        self.table_test_suite.sortByColumn(1, Qt.AscendingOrder)
+        self.test_suite_model.sort(1, Qt.AscendingOrder)
+        self.resize_rows()
 
         QApplication.processEvents()
 
@@ -317,14 +390,10 @@ class MainWindow(QWidget):
         If param return_all = True and if none checked, returns all indexes.
         """
 
-        checked_row_indexes = []
-
-        for row_index in range(self.table_test_suite.rowCount()):
-            if self.table_test_suite.item(row_index, 0).checkState() == Qt.Checked:
-                checked_row_indexes.append(row_index)
+        checked_row_indexes = self.test_suite_model.get_checked_rows()
 
         if return_all and not checked_row_indexes:
-            return list(range(self.table_test_suite.rowCount()))
+            return list(self.test_suite_model.order)
 
         return checked_row_indexes
 
@@ -350,7 +419,7 @@ class MainWindow(QWidget):
 
         rows_to_remove = self.get_checked_row_indexes(return_all=False)
 
-        if not self.table_test_suite.rowCount():
+        if not self.test_suite_model.num_tests:
             throw_message(MessageEnum.CRITICAL, "Error", "There is no test case to remove!")
             return
         elif not rows_to_remove:
@@ -358,11 +427,11 @@ class MainWindow(QWidget):
             return
 
         if self.reset_main_window() != MessageEnum.NO:
-            for row_index in reversed(rows_to_remove):
-                self.table_test_suite.removeRow(row_index)
-                self.label_total_value.setText(f"{self.table_test_suite.rowCount()}")
+            self.test_suite_model.remove_rows(rows_to_remove)
+            self.label_total_value.setText(f"{self.test_suite_model.num_tests}")
 
-            self.table_test_suite.resizeRowsToContents()
+            self.resize_rows()
+            self.index_timer.start()
 
     def on_btn_load_tests_click(self):
         """Open dialog box to select test case source"""
@@ -373,16 +442,17 @@ class MainWindow(QWidget):
             # Close the widget first
             widget.close()
 
-            self.test_cases_path = path
-
-            with open(path) as csv_file:
-                header = csv_file.readline().strip()
-                if header != "data_call,test_input,expected_output":
-                    throw_message(MessageEnum.CRITICAL, "Import Error", f"{path} is malformed!")
+            # Compiled suites hold parsed test cases, which fill the table as
+            # they are, CSV rows are formatted for the table
+            if path.endswith(SUITE_EXTENSION):
+                try:
+                    test_suite = TestSuite(path)
+                except ValueError as error:
+                    throw_message(MessageEnum.CRITICAL, "Import Error", str(error))
                     return
 
-                csv_row_count = len(csv_file.readlines())
-                if csv_row_count < 1:
+                if len(test_suite) < 1:
+                    test_suite.close()
                     throw_message(
                         MessageEnum.CRITICAL,
                         "Import Error",
@@ -390,39 +460,59 @@ class MainWindow(QWidget):
                     )
                     return
 
-            with open(path) as csv_file:
-                csv_reader = csv.reader(csv_file, delimiter=',')
-
-                # Skip the header
-                next(csv_reader)
-
-                for index, row in enumerate(csv_reader):
-                    csv_data_call, csv_test_input, csv_expected_output = row
+                rows = [test_case.to_table() for test_case in test_suite]
+                csv_path = test_suite.source_path
+                test_suite.close()
 
-                    # Insert a new row first
-                    self.table_test_suite.setRowCount(index + 1)
-
-                    # Create items for each column of the row
-                    item_checkbox = QTableWidgetItem(None)
-                    item_data_call = QTableWidgetItem(csv_data_call)
-                    item_test_input = QTableWidgetItem(format_table_item(csv_test_input))
-                    item_expected_output = QTableWidgetItem(format_table_item(csv_expected_output))
-                    item_test_output = QTableWidgetItem('')
+            else:
+                with open(path) as csv_file:
+                    header = csv_file.readline().strip()
+                    if header != "data_call,test_input,expected_output":
+                        throw_message(MessageEnum.CRITICAL, "Import Error", f"{path} is malformed!")
+                        return
+
+                    csv_row_count = len(csv_file.readlines())
+                    if csv_row_count < 1:
+                        throw_message(
+                            MessageEnum.CRITICAL,
+                            "Import Error",
+                            "No available test case to import!"
+                        )
+                        return
+
+                with open(path) as csv_file:
+                    csv_reader = csv.reader(csv_file, delimiter=',')
+
+                    # Skip the header
+                    next(csv_reader)
+
+                    rows = [
+                        (
+                            data_call,
+                            format_table_item(test_input),
+                            format_table_item(expected_output)
+                        )
+                        for data_call, test_input, expected_output in csv_reader
+                    ]
+
+                csv_path = path
+
+            self.test_suite_model.set_rows(rows)
 
-                    item_checkbox.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                    item_checkbox.setCheckState(Qt.Unchecked)
+            self.test_cases_path = path
+            self.test_cases_csv_path = csv_path
 
-                    self.table_test_suite.setItem(index, 0, item_checkbox)
-                    self.table_test_suite.setItem(index, 1, item_data_call)
-                    self.table_test_suite.setItem(index, 2, item_test_input)
-                    self.table_test_suite.setItem(index, 3, item_expected_output)
-                    self.table_test_suite.setItem(index, 4, item_test_output)
+            # Loading shows all tests, so the search is applied again
+            if self.searchbar.text():
+                self.update_table_test_suite()
+            else:
+                self.resize_rows()
 
-                self.table_test_suite.resizeRowsToContents()
+            self.index_timer.start()
 
-                self.label_total_value.setText(f"{self.table_test_suite.rowCount()}")
+            self.label_total_value.setText(f"{self.test_suite_model.num_tests}")
 
-        if self.table_test_suite.rowCount():
+        if self.test_suite_model.num_tests:
             ret_val = throw_message(
                 MessageEnum.WARNING,
                 "Warning",
@@ -470,55 +560,50 @@ class MainWindow(QWidget):
     def on_btn_save_tests_click(self):
         """Override test cases source by using the cases in the table"""
 
-        if not self.table_test_suite.rowCount():
+        if not self.test_suite_model.num_tests:
             throw_message(MessageEnum.CRITICAL, "Save Error", "No available test case to save!")
             return
 
-        ret_val = throw_message(
-            MessageEnum.WARNING,
-            "Warning",
-            "Are you sure you want to override the test cases?"
-        )
+        # Compiled suites are saved into the CSV file they were compiled from,
+        # then compiled again
+        message = f"Are you sure you want to override the test cases in {self.test_cases_csv_path}"
+        if self.test_cases_csv_path != self.test_cases_path:
+            message += f" and compile them into {self.test_cases_path}"
+
+        ret_val = throw_message(MessageEnum.WARNING, "Warning", f"{message}?")
         if ret_val == MessageEnum.NO:
             return
 
-        with open(self.test_cases_path, 'w') as csv_file:
+        with open(self.test_cases_csv_path, 'w') as csv_file:
 
             csv_writer = csv.writer(csv_file, delimiter=',')
             csv_writer.writerow(["data_call", "test_input", "expected_output"])
 
             for row_index in self.get_checked_row_indexes():
-                data_call = self.table_test_suite.item(row_index, 1).text()
-                test_input = format_table_item(
-                    self.table_test_suite.item(row_index, 2).text(),
-                    csv_to_table=False
-                )
-                expected_output = format_table_item(
-                    self.table_test_suite.item(row_index, 3).text(),
-                    csv_to_table=False
-                )
+                data_call, test_input, expected_output = self.test_suite_model.get_row(row_index)
+                test_input = format_table_item(test_input, csv_to_table=False)
+                expected_output = format_table_item(expected_output, csv_to_table=False)
 
                 csv_writer.writerow([data_call, test_input, expected_output])
 
+        if self.test_cases_csv_path != self.test_cases_path:
+            compile_suite(self.test_cases_csv_path, self.test_cases_path)
+
     def on_checkbox_select_all(self):
         """
         Select/deselect all the currently visible tests. Applicable while searching
         for tests using the searchbar and selecting all found tests in bulk.
         """
 
-        if self.checkbox_select_all.isChecked():
-            for row in range(self.table_test_suite.rowCount()):
-                if not self.table_test_suite.isRowHidden(row):
-                    self.table_test_suite.item(row, 0).setCheckState(Qt.Checked)
-        else:
-            for row in range(self.table_test_suite.rowCount()):
-                if not self.table_test_suite.isRowHidden(row):
-                    self.table_test_suite.item(row, 0).setCheckState(Qt.Unchecked)
+        self.test_suite_model.set_checked(
+            self.test_suite_model.get_shown_rows(),
+            self.checkbox_select_all.isChecked()
+        )
 
     def on_btn_run_click(self):
         """Run all/selected test cases in the table"""
 
-        if not self.table_test_suite.rowCount():
+        if not self.test_suite_model.num_tests:
             throw_message(MessageEnum.CRITICAL, "Run Error", "No available test case to run!")
             return
 
@@ -526,37 +611,27 @@ class MainWindow(QWidget):
         host = self.combobox_host.currentText()
         port = None if not self.port.text() else self.port.text()
 
-        # Re-order the table
-        for row in range(self.table_test_suite.rowCount()):
-            if self.table_test_suite.item(row, 0).checkState() == Qt.Checked:
-                self.table_test_suite.item(row, 0).setText("checked")
-
-        self.table_test_suite.sortByColumn(1, Qt.AscendingOrder)
-        self.table_test_suite.sortByColumn(0, Qt.DescendingOrder)
-
-        for row in range(self.table_test_suite.rowCount()):
-            if self.table_test_suite.item(row, 0).checkState() == Qt.Checked:
-                self.table_test_suite.item(row, 0).setText("")
+        # Re-order the table, checked tests first
+        self.test_suite_model.sort(1, Qt.AscendingOrder)
+        self.test_suite_model.sort(0, Qt.DescendingOrder)
+        self.resize_rows()
 
         self.label_passed_value.setStyleSheet(StyleEnum.STATS_PASSED)
         self.label_failed_value.setStyleSheet(StyleEnum.STATS_FAILURE)
         self.label_timed_out_value.setStyleSheet(StyleEnum.STATS_TIMEOUT)
 
-        asyncio.run(self.run_tests(self.get_checked_row_indexes(), host, port))
+        self.start_tests(self.get_checked_row_indexes(), [(host, port)])
 
     def on_btn_compare_sources_click(self):
         """Open the comparison widget to choose a API source to compare"""
 
         def _on_btn_compare_click(widget, second_host, port_second_host):
-            """
-            Compare two API sources and lists only the test cases that
-            fail on one source and pass on the other and vice versa
-            """
+            """Start comparing two API sources, see compare_test_results"""
 
             # Close the widget first
             widget.close()
 
-            if not self.table_test_suite.rowCount():
+            if not self.test_suite_model.num_tests:
                 throw_message(MessageEnum.CRITICAL, "Run Error", "No available test case to run!")
                 return
 
@@ -566,51 +641,14 @@ class MainWindow(QWidget):
             port_main_host = None if not self.port.text() else self.port.text()
             port_second_host = None if not port_second_host else port_second_host
 
-            failed_tests_main_host = asyncio.run(
-                self.run_tests(tests_to_run, main_host, port_main_host, True)
-            )
-
-            self.reset_main_window(confirmation=False, clear_checkboxes=False)
-
-            # Change the combobox on main window to indicate the host of second run
-            self.combobox_host.setCurrentIndex(HOSTS.index(second_host))
+            # Each test is sent to both hosts at once, see TestRunner
+            self.compared_hosts = (main_host, second_host)
 
-            failed_tests_second_host = asyncio.run(
-                self.run_tests(
-                    tests_to_run,
-                    second_host,
-                    port_second_host,
-                    return_failed_tests=True
-                )
+            self.start_tests(
+                tests_to_run,
+                [(main_host, port_main_host), (second_host, port_second_host)]
             )
 
-            self.reset_main_window(confirmation=False, clear_checkboxes=False)
-
-            failed_tests_main_host, failed_tests_second_host = (
-                set(failed_tests_main_host) - set(failed_tests_second_host),
-                set(failed_tests_second_host) - set(failed_tests_main_host)
-            )
-
-            for row_index in failed_tests_main_host:
-                item_failed_output = QTableWidgetItem(f"Failed at {main_host}")
-                self.table_test_suite.setItem(row_index, 4, item_failed_output)
-                self.colorize_table_row(row_index, ColorEnum.BLACK, ColorEnum.FAILURE)
-
-            for row_index in failed_tests_second_host:
-                item_failed_output = QTableWidgetItem(f"Failed at {second_host}")
-                self.table_test_suite.setItem(row_index, 4, item_failed_output)
-                self.colorize_table_row(row_index, ColorEnum.BLACK, ColorEnum.FAILURE_SECOND_HOST)
-
-            self.table_test_suite.resizeRowsToContents()
-
-            if len(failed_tests_main_host) == 0 and len(failed_tests_second_host) == 0:
-                throw_message(
-                    MessageEnum.WARNING,
-                    "Warning!",
-                    "The sources are identical for the selected cases"
-                )
-                return
-
         if self.reset_main_window(clear_checkboxes=False) != MessageEnum.NO:
 
             main_host = self.combobox_host.currentText()
@@ -671,113 +709,153 @@ class MainWindow(QWidget):
 
             comparison_widget.exec()
 
-    async def run_tests(self, tests_to_run, host, port, return_failed_tests=False):
-
-        async def _run_routine(test_case):
-
-            data_call = self.table_test_suite.item(test_case, 1).text()
-            test_input = self.table_test_suite.item(test_case, 2).text()
-            expected_output = self.table_test_suite.item(test_case, 3).text()
-
-            # Format table items for the run_test method of the TestStat class
-            test_input = test_input.replace("\n", '&').replace(' ', '')
-            expected_pairs = expected_output.lower().replace(' ', '').split("\n")
-
-            expected_output = {}
-            for param_value_pair in expected_pairs:
-                # Inputs may include more than one '='
-                param, value = param_value_pair.split('=', 1)
-                expected_output[param] = value
-
-            # test_output:
-            #   {}  -> test is successful
-            #   int -> test could not be executed (connection error, timeout)
-            #   {param: val} -> test output that does not match with expected
-            test_output = await teststat.run_test(data_call, test_input, expected_output)
+    def start_tests(self, tests_to_run, hosts):
+        """Run the tests of given rows at (host, port) hosts in the background, see TestRunner"""
 
-            return test_case, test_output
+        test_cases = [
+            self.test_suite_model.get_test_case(row).renumber(row)
+            for row in tests_to_run
+        ]
 
-        self.running = True
-        num_tests_run = 0
-        num_passed_tests = 0
-        num_failed_tests = 0
-        num_timed_out_tests = 0
-        num_total_tests = len(tests_to_run)
-        failed_tests = []
+        self.num_passed_tests = 0
+        self.num_failed_tests = 0
+        self.num_timed_out_tests = 0
 
         self.progressbar.show()
-        self.progressbar.setProperty("maximum", num_total_tests)
+        self.progressbar.setProperty("maximum", len(test_cases))
 
-        self.label_passed_value.setText(f"{num_passed_tests}")
+        self.label_passed_value.setText(f"{self.num_passed_tests}")
 
-        teststat = TestStat(host, port)
+        for control in self.run_controls:
+            control.setEnabled(False)
 
-        # As soon as a coroutine returns, process the output and update the GUI
-        for routine in asyncio.as_completed([_run_routine(test) for test in tests_to_run]):
+        self.runner.start(test_cases, hosts)
 
-            if self.stop:
-                self.stop = False
-                self.running = False
-                break
+    def buffer_test_results(self, test_results):
+        """Keep a batch of test results sent by the runner until the next frame"""
 
-            row_index, test_output = await routine
+        self.pending_results.extend(test_results)
 
-            self.previous_results = True
+        if not self.frame_timer.isActive():
+            self.frame_timer.start()
 
-            # Error handling
+    def apply_test_results(self):
+        """
+        Show the pending test results at once: one repaint of the table, and
+        one update of the counters and the progress bar. Only the rows of
+        failed tests are resized, as their outputs span multiple lines.
+        """
 
-            if test_output == MessageEnum.TIMEOUT:
-                num_tests_run += 1
-                num_timed_out_tests += 1
-                self.label_timed_out_value.setText(f"{num_timed_out_tests}")
-                self.progressbar.setProperty("value", num_tests_run)
+        self.frame_timer.stop()
 
-                timed_out_item = QTableWidgetItem("Error: Connection timed out!")
-                self.table_test_suite.setItem(row_index, 4, timed_out_item)
+        test_results, self.pending_results = self.pending_results, []
+        if not test_results:
+            return
 
-                self.colorize_table_row(row_index, ColorEnum.BLACK, ColorEnum.TIMEOUT)
+        self.previous_results = True
+        failed_rows = []
+        results = []
 
-                failed_tests.append(row_index)
+        for test_result in test_results:
 
+            # Results of a comparison come per test as (main host, second host)
+            if isinstance(test_result, tuple):
+                results.append(self.compare_test_results(*test_result))
                 continue
 
-            elif test_output == MessageEnum.CONNECTION_ERROR:
-                throw_message(
-                    MessageEnum.CRITICAL,
-                    "Connection Error",
-                    "Connection could not be established!"
-                )
-                self.reset_main_window(confirmation=False)
+            row_index = test_result.test_case.row_index
 
-                return
+            if test_result.status == TestResult.TIMED_OUT:
+                self.num_timed_out_tests += 1
+                output = "Error: Connection timed out!"
 
-            num_tests_run += 1
-            self.progressbar.setProperty("value", num_tests_run)
+            elif test_result.status == TestResult.PASSED:
+                self.num_passed_tests += 1
+                output = ""
 
-            if not test_output:
-                num_passed_tests += 1
-                self.label_passed_value.setText(f"{num_passed_tests}")
-                self.table_test_suite.setItem(row_index, 4, QTableWidgetItem(""))
-                self.colorize_table_row(row_index, ColorEnum.BLACK, ColorEnum.SUCCESS)
             else:
-                num_failed_tests += 1
-                self.label_failed_value.setText(f"{num_failed_tests}")
-                failed_tests.append(row_index)
+                self.num_failed_tests += 1
                 failed_output = []
-                for param, value in test_output.items():
+                for param, value in test_result.output.items():
                     failed_output.append(f"{param} = {value}")
 
-                item_failed_output = QTableWidgetItem("\n".join(failed_output))
-                self.table_test_suite.setItem(row_index, 4, item_failed_output)
-                self.table_test_suite.resizeRowsToContents()
-                self.colorize_table_row(row_index, ColorEnum.BLACK, ColorEnum.FAILURE)
+                output = "\n".join(failed_output)
+                failed_rows.append(row_index)
+
+            results.append((row_index, test_result.status, output))
 
-        self.running = False
-        await teststat.session.close()
+        self.test_suite_model.set_results(results)
 
-        if return_failed_tests:
-            return failed_tests
+        self.label_passed_value.setText(f"{self.num_passed_tests}")
+        self.label_failed_value.setText(f"{self.num_failed_tests}")
+        self.label_timed_out_value.setText(f"{self.num_timed_out_tests}")
+        self.progressbar.setProperty(
+            "value",
+            self.num_passed_tests + self.num_failed_tests + self.num_timed_out_tests
+        )
+
+        if failed_rows:
+            self.resize_rows(failed_rows)
+
+    def on_run_finished(self, summary):
+
+        # The last results are shown before the run is concluded
+        self.apply_test_results()
+
+        for control in self.run_controls:
+            control.setEnabled(True)
+
+        compared_hosts, self.compared_hosts = self.compared_hosts, None
+
+        if summary["error"]:
+            throw_message(
+                MessageEnum.CRITICAL,
+                "Run Error",
+                f"The run stopped unexpectedly!\n{summary['error']}"
+            )
+            return
+
+        if summary["connection_error"]:
+            throw_message(
+                MessageEnum.CRITICAL,
+                "Connection Error",
+                "Connection could not be established!"
+            )
+            self.reset_main_window(confirmation=False)
+            return
+
+        if compared_hosts and not summary["stopped"] and not self.num_failed_tests:
+            throw_message(
+                MessageEnum.WARNING,
+                "Warning!",
+                "The sources are identical for the selected cases"
+            )
+
+    def compare_test_results(self, main_host_result, second_host_result):
+        """
+        Return the (row index, status, output) to show for a test run at both
+        hosts of the comparison. Only tests that fail at one host and pass at
+        the other are listed; they count as failed, the others as passed.
+        """
+
+        main_host, second_host = self.compared_hosts
+        row_index = main_host_result.test_case.row_index
+
+        passed_main_host = main_host_result.status == TestResult.PASSED
+        passed_second_host = second_host_result.status == TestResult.PASSED
+
+        if passed_main_host == passed_second_host:
+            self.num_passed_tests += 1
+            return row_index, None, ""
+
+        self.num_failed_tests += 1
+
+        if passed_main_host:
+            return row_index, FAILED_SECOND_HOST, f"Failed at {second_host}"
+
+        return row_index, TestResult.FAILED, f"Failed at {main_host}"
 
     def stop_tests(self):
-        if self.running:
-            self.stop = True
+        """Stop the run immediately, cancelling the requests in flight"""
+
+        self.runner.stop()
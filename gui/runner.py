@@ -0,0 +1,197 @@
+import asyncio
+import threading
+
+from core.config import GUI_BATCH_INTERVAL, POOL_SIZE
+from core.model import TestResult
+from core.pool import ConnectionPool
+from core.teststat import TestStat
+from core.utils import MessageEnum, run_in_window
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class TestRunner(QObject):
+    """
+    Run test cases on the event loop of a worker thread, so that the window
+    keeps responding during a run. Results are sent to the window through
+    signals, which Qt delivers on the thread of the window:
+        results_ready -> list of results completed since the last batch, sent
+                         every GUI_BATCH_INTERVAL seconds. A result is a
+                         TestResult when running a single host, or a tuple of
+                         TestResult objects, one per host, when comparing hosts.
+        run_finished  -> summary of the run, see _run. It is sent however the
+                         run ends, including on an unexpected error.
+    The event loop outlives a single run, so connections are pooled across
+    runs and hosts.
+    """
+
+    results_ready = pyqtSignal(list)
+    run_finished = pyqtSignal(dict)
+
+    def __init__(self):
+
+        super().__init__()
+
+        self.pool = ConnectionPool()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        self.running = False
+        self._future = None
+        self._batch = []
+
+    def start(self, test_cases, hosts):
+        """
+        Run test_cases against the (host, port) pairs of hosts in the
+        background, unless a run is in progress. With more than one host,
+        each test case is sent to all of them at once.
+        """
+
+        if self.running:
+            return False
+
+        self.running = True
+        self._future = asyncio.run_coroutine_threadsafe(
+            self._run(test_cases, hosts),
+            self.loop
+        )
+
+        return True
+
+    def stop(self):
+        """Cancel the run, including its requests in flight"""
+
+        if self.running:
+            self._future.cancel()
+
+    def close(self):
+        """Stop the run, close pooled connections and the event loop"""
+
+        self.stop()
+
+        asyncio.run_coroutine_threadsafe(self.pool.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _run(self, test_cases, hosts):
+        """
+        Run test_cases and send their results in batches. The summary sent at
+        the end includes the hosts, the row indexes of tests failed or timed
+        out at any host, whether the run was stopped or lost a connection,
+        and the error that ended it unexpectedly, if any.
+        """
+
+        summary = {
+            "hosts": [host for host, _ in hosts],
+            "failed": [],
+            "stopped": False,
+            "connection_error": False,
+            "error": None
+        }
+
+        teststats = []
+        results = None
+
+        flusher = asyncio.ensure_future(self._flush_periodically())
+
+        try:
+            teststats = [TestStat(host, port, pool=self.pool) for host, port in hosts]
+
+            # Tests of a comparison take a request per host, which share the pool
+            results = run_in_window(
+                (self._run_test_at_hosts(teststats, test_case) for test_case in test_cases),
+                max(POOL_SIZE // len(hosts), 1)
+            )
+
+            async for results_per_host in results:
+
+                if any(
+                    result.error == MessageEnum.CONNECTION_ERROR for result in results_per_host
+                ):
+                    summary["connection_error"] = True
+                    break
+
+                if any(result.status != TestResult.PASSED for result in results_per_host):
+                    summary["failed"].append(results_per_host[0].test_case.row_index)
+
+                if len(results_per_host) == 1:
+                    self._batch.append(results_per_host[0])
+                else:
+                    self._batch.append(results_per_host)
+
+        except asyncio.CancelledError:
+            summary["stopped"] = True
+
+        # Nothing catches errors on the worker thread, so they are sent to the
+        # window instead, which would otherwise wait for the run forever
+        except Exception as error:
+            summary["error"] = f"{type(error).__name__}: {error}"
+
+        finally:
+            # Cancels the tests still in flight
+            if results is not None:
+                await results.aclose()
+            for teststat in teststats:
+                await teststat.close()
+
+            flusher.cancel()
+            self._flush()
+
+            self.running = False
+            self.run_finished.emit(summary)
+
+    @classmethod
+    async def _run_test_at_hosts(cls, teststats, test_case):
+        """Run test_case at all hosts concurrently, so they are sampled at the same moment"""
+
+        return tuple(
+            await asyncio.gather(*(cls._run_test(teststat, test_case) for teststat in teststats))
+        )
+
+    @staticmethod
+    async def _run_test(teststat, test_case):
+
+        # test_output:
+        #   {}  -> test is successful
+        #   int -> test could not be executed (connection error, timeout)
+        #   {param: val} -> test output that does not match with expected
+        test_output = await teststat.run_test(
+            test_case.data_call,
+            test_case.query_input,
+            test_case.expected_output
+        )
+
+        if test_output == MessageEnum.TIMEOUT:
+            return TestResult(test_case, TestResult.TIMED_OUT, error=test_output)
+        elif test_output == MessageEnum.BAD_GATEWAY:
+            return TestResult(
+                test_case,
+                TestResult.FAILED,
+                {"error": "502 Bad Gateway"},
+                error=test_output
+            )
+        elif test_output == MessageEnum.CONNECTION_ERROR:
+            return TestResult(
+                test_case,
+                TestResult.FAILED,
+                {"error": "Connection error"},
+                error=test_output
+            )
+        elif test_output:
+            return TestResult(test_case, TestResult.FAILED, test_output)
+
+        return TestResult(test_case, TestResult.PASSED)
+
+    async def _flush_periodically(self):
+
+        while True:
+            await asyncio.sleep(GUI_BATCH_INTERVAL)
+            self._flush()
+
+    def _flush(self):
+
+        if self._batch:
+            self.results_ready.emit(self._batch)
+            self._batch = []
@@ -0,0 +1,65 @@
+from array import array
+
+
+class TrigramIndex():
+    """
+    Index of texts by their trigrams, i.e. substrings of 3 characters, to
+    find the texts containing a query without scanning all of them. Texts
+    and queries are compared in lower case. Candidates of a query are the
+    texts having its rarest trigram, which are then checked for the query
+    itself. Hence updated texts are not reindexed but checked on every
+    query, and queries shorter than a trigram scan all texts.
+    """
+
+    def __init__(self, texts=()):
+
+        self.texts = []
+        self.postings = {}
+        self.updated = set()
+
+        for text in texts:
+            self.add(text)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, text):
+        """Index text as the next row"""
+
+        row = len(self.texts)
+        text = text.lower()
+
+        self.texts.append(text)
+
+        for trigram in {text[index:index + 3] for index in range(len(text) - 2)}:
+            postings = self.postings.get(trigram)
+
+            if postings is None:
+                self.postings[trigram] = array('I', [row])
+            else:
+                postings.append(row)
+
+    def update(self, row, text):
+        """Replace the text of row"""
+
+        self.texts[row] = text.lower()
+        self.updated.add(row)
+
+    def search(self, query):
+        """Return the set of rows whose text contains query"""
+
+        query = query.lower()
+
+        if len(query) < 3:
+            return {row for row, text in enumerate(self.texts) if query in text}
+
+        # Only the texts having the rarest trigram of the query are checked
+        candidates = min(
+            (self.postings.get(query[index:index + 3], ()) for index in range(len(query) - 2)),
+            key=len
+        )
+
+        rows = {row for row in candidates if query in self.texts[row]}
+        rows.update(row for row in self.updated if query in self.texts[row])
+
+        return rows
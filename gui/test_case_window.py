@@ -3,7 +3,7 @@ from core.config import DATA_CALL_MAP, ParamsCommons
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QPushButton, QLabel, QComboBox, \
-    QTableWidgetItem, QCheckBox, QLineEdit, QFormLayout, QVBoxLayout, QScrollArea
+    QCheckBox, QLineEdit, QFormLayout, QVBoxLayout, QScrollArea
 
 
 class TestCaseWindow(QWidget):
@@ -321,10 +321,6 @@ class TestCaseWindow(QWidget):
                 throw_message(MessageEnum.CRITICAL, "Error", "Missing required parameters!")
                 return
 
-        # Create a new row in the table
-        row_count = self.main_ui.table_test_suite.rowCount()
-        self.main_ui.table_test_suite.setRowCount(row_count + 1)
-
         test_input = _get_input_params(
             DATA_CALL_MAP[self.data_call]["required_params"]
             + DATA_CALL_MAP[self.data_call]["optional_params"]
@@ -345,27 +341,12 @@ class TestCaseWindow(QWidget):
         test_input = "\n".join(test_input)
         expected_output = "\n".join(expected_output)
 
-        # Create table items
-        item_checkbox = QTableWidgetItem(None)
-        item_data_call = QTableWidgetItem(self.data_call)
-        item_test_input = QTableWidgetItem(test_input)
-        item_expected_output = QTableWidgetItem(expected_output)
-        item_test_output = QTableWidgetItem('')
-
-        item_checkbox.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-        item_checkbox.setCheckState(Qt.Unchecked)
-
-        # Set table items
-        self.main_ui.table_test_suite.setItem(row_count, 0, item_checkbox)
-        self.main_ui.table_test_suite.setItem(row_count, 1, item_data_call)
-        self.main_ui.table_test_suite.setItem(row_count, 2, item_test_input)
-        self.main_ui.table_test_suite.setItem(row_count, 3, item_expected_output)
-        self.main_ui.table_test_suite.setItem(row_count, 4, item_test_output)
-
-        self.main_ui.table_test_suite.resizeRowsToContents()
+        # Add the test case to the table
+        row = self.main_ui.test_suite_model.append_row(self.data_call, test_input, expected_output)
+        self.main_ui.resize_rows([row])
 
         # Update test case count in the main window
-        self.main_ui.label_total_value.setText(f"{self.main_ui.table_test_suite.rowCount()}")
+        self.main_ui.label_total_value.setText(f"{self.main_ui.test_suite_model.num_tests}")
 
         self.close()
 
@@ -0,0 +1,403 @@
+from array import array
+
+from core.model import TestCase, TestResult
+from gui.search_index import TrigramIndex
+from gui.utils import ColorEnum
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QBrush, QColor
+
+
+HEADERS = ["", "Data Call", "Test Input", "Expected Output", "Output"]
+
+# Result of a test that fails only at the second host of a comparison
+FAILED_SECOND_HOST = "failed-second-host"
+
+# Statuses are stored as their index here, None is a row without a result
+STATUSES = (None, TestResult.PASSED, TestResult.FAILED, TestResult.TIMED_OUT, FAILED_SECOND_HOST)
+
+# Text and background colors of rows per status
+STATUS_COLORS = {
+    None: (ColorEnum.UI_FONT, ColorEnum.WHITE),
+    TestResult.PASSED: (ColorEnum.BLACK, ColorEnum.SUCCESS),
+    TestResult.FAILED: (ColorEnum.BLACK, ColorEnum.FAILURE),
+    TestResult.TIMED_OUT: (ColorEnum.BLACK, ColorEnum.TIMEOUT),
+    FAILED_SECOND_HOST: (ColorEnum.BLACK, ColorEnum.FAILURE_SECOND_HOST)
+}
+
+# Columns that can be edited in the table
+EDITABLE_COLUMNS = (2, 4)
+
+# Columns matched by searches
+SEARCH_COLUMNS = (1, 2, 3)
+
+# Columns a test case is parsed from
+PARSED_COLUMNS = (1, 2, 3)
+
+
+class TestSuiteModel(QAbstractTableModel):
+    """
+    Test cases of the table, kept column by column: texts in lists, check
+    states in a bytearray and result statuses in an array of STATUSES
+    indexes. The view asks only for the cells it paints, so the table holds
+    no item objects, and colors are derived from the status of a row.
+    Texts are kept in the format of the table, i.e. one param per line.
+
+    The row of a test case is its position in these columns, which sorting
+    and searching leave as it is: the table shows rows in `order`, and only
+    those matching the search, if any. Rows given to and returned by this
+    model are these rows, whereas indexes of the view refer to rows shown.
+    """
+
+    def __init__(self, header_font=None, parent=None):
+
+        super().__init__(parent)
+
+        self.header_font = header_font
+
+        self.data_calls = []
+        self.test_inputs = []
+        self.expected_outputs = []
+        self.outputs = []
+        self.checks = bytearray()
+        self.statuses = array('B')
+
+        self.num_checked = 0
+
+        # TestCase of each row, parsed on demand and until the row is edited
+        self.test_cases = []
+
+        # Rows in sorted order, and those of them shown in the table
+        self.order = array('I')
+        self.shown_rows = array('I')
+
+        # Rows matching the search, None if not searching
+        self.search_rows = None
+        self.search_index = TrigramIndex()
+
+        # Row -> its position in the table, -1 if not shown. Built on demand.
+        self._view_rows = None
+
+        status_brushes = {
+            status: (QBrush(QColor(text_color)), QBrush(QColor(background_color)))
+            for status, (text_color, background_color) in STATUS_COLORS.items()
+        }
+        self._brushes = [status_brushes[status] for status in STATUSES]
+
+    @property
+    def num_tests(self):
+        return len(self.data_calls)
+
+    # Qt model interface
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.shown_rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+
+        if orientation != Qt.Horizontal:
+            return None
+
+        if role == Qt.DisplayRole:
+            return HEADERS[section]
+        elif role == Qt.FontRole:
+            return self.header_font
+
+        return None
+
+    def flags(self, index):
+
+        if index.column() == 0:
+            return Qt.ItemIsUserCheckable | Qt.ItemIsEnabled
+
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+        if index.column() in EDITABLE_COLUMNS:
+            flags |= Qt.ItemIsEditable
+
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+
+        row, column = self.shown_rows[index.row()], index.column()
+
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            if column == 0:
+                return None
+            return self._get_column(column)[row]
+
+        elif role == Qt.CheckStateRole and column == 0:
+            return Qt.Checked if self.checks[row] else Qt.Unchecked
+
+        elif role == Qt.ForegroundRole:
+            return self._brushes[self.statuses[row]][0]
+
+        elif role == Qt.BackgroundRole:
+            return self._brushes[self.statuses[row]][1]
+
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+
+        row, column = self.shown_rows[index.row()], index.column()
+
+        if role == Qt.CheckStateRole and column == 0:
+            self.set_checked([row], value == Qt.Checked)
+            return True
+
+        elif role == Qt.EditRole and column in EDITABLE_COLUMNS:
+            self._get_column(column)[row] = value
+
+            if column in PARSED_COLUMNS:
+                self.test_cases[row] = None
+
+            if column in SEARCH_COLUMNS and row < len(self.search_index):
+                self.search_index.update(row, self._get_search_text(row))
+
+            self.dataChanged.emit(index, index, [role])
+            return True
+
+        return False
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort rows stably by given column, checked rows first for column 0 in ascending order"""
+
+        if column == 0:
+            keys = [1 - check for check in self.checks]
+        else:
+            keys = self._get_column(column)
+
+        self.layoutAboutToBeChanged.emit()
+
+        # Indexes kept by the view follow their rows to the new positions
+        persistent_indexes = self.persistentIndexList()
+        persistent_rows = [self.shown_rows[index.row()] for index in persistent_indexes]
+
+        self.order = array(
+            'I',
+            sorted(self.order, key=keys.__getitem__, reverse=order == Qt.DescendingOrder)
+        )
+        self._update_shown_rows()
+
+        view_rows = self._get_view_rows()
+        self.changePersistentIndexList(
+            persistent_indexes,
+            [
+                self.index(view_rows[row], index.column())
+                for row, index in zip(persistent_rows, persistent_indexes)
+            ]
+        )
+
+        self.layoutChanged.emit()
+
+    # Test cases
+    def set_rows(self, rows):
+        """Replace all test cases with given (data call, test input, expected output) rows"""
+
+        self.beginResetModel()
+
+        self.data_calls = [data_call for data_call, _, _ in rows]
+        self.test_inputs = [test_input for _, test_input, _ in rows]
+        self.expected_outputs = [expected_output for _, _, expected_output in rows]
+        self.outputs = [''] * len(rows)
+        self.checks = bytearray(len(rows))
+        self.statuses = array('B', bytes(len(rows)))
+        self.num_checked = 0
+        self.test_cases = [None] * len(rows)
+
+        self.order = array('I', range(len(rows)))
+        self.search_rows = None
+        self.search_index = TrigramIndex()
+        self._update_shown_rows()
+
+        self.endResetModel()
+
+    def append_row(self, data_call, test_input, expected_output):
+        """Add a test case and return its row. It is shown even if it does not match the search."""
+
+        row = self.num_tests
+        view_row = len(self.shown_rows)
+
+        self.beginInsertRows(QModelIndex(), view_row, view_row)
+
+        self.data_calls.append(data_call)
+        self.test_inputs.append(test_input)
+        self.expected_outputs.append(expected_output)
+        self.outputs.append('')
+        self.checks.append(0)
+        self.statuses.append(0)
+        self.test_cases.append(None)
+
+        self.order.append(row)
+        self.shown_rows.append(row)
+        if self.search_rows is not None:
+            self.search_rows.add(row)
+        self._view_rows = None
+
+        self.endInsertRows()
+
+        return row
+
+    def remove_rows(self, rows):
+
+        rows_to_remove = set(rows)
+        rows_to_keep = [row for row in range(self.num_tests) if row not in rows_to_remove]
+        new_rows = {row: new_row for new_row, row in enumerate(rows_to_keep)}
+
+        self.beginResetModel()
+
+        for name in ["data_calls", "test_inputs", "expected_outputs", "outputs", "test_cases"]:
+            values = getattr(self, name)
+            setattr(self, name, [values[row] for row in rows_to_keep])
+
+        self.checks = bytearray(self.checks[row] for row in rows_to_keep)
+        self.statuses = array('B', [self.statuses[row] for row in rows_to_keep])
+        self.num_checked = sum(self.checks)
+
+        # Rows are renumbered, so the search index is built again
+        self.order = array('I', [new_rows[row] for row in self.order if row in new_rows])
+        if self.search_rows is not None:
+            self.search_rows = {new_rows[row] for row in self.search_rows if row in new_rows}
+        self.search_index = TrigramIndex()
+        self._update_shown_rows()
+
+        self.endResetModel()
+
+    def get_row(self, row):
+        """Return data call, test input and expected output of row"""
+
+        return self.data_calls[row], self.test_inputs[row], self.expected_outputs[row]
+
+    def get_test_case(self, row):
+        """Return the TestCase of row, without a row index. Rows are parsed once until edited."""
+
+        test_case = self.test_cases[row]
+
+        if test_case is None:
+            test_case = TestCase.from_table(None, *self.get_row(row))
+            self.test_cases[row] = test_case
+
+        return test_case
+
+    def get_shown_rows(self):
+        return list(self.shown_rows)
+
+    def get_view_rows(self, rows):
+        """Return positions of given rows in the table, skipping those not shown"""
+
+        view_rows = self._get_view_rows()
+
+        return [view_rows[row] for row in rows if view_rows[row] >= 0]
+
+    # Search
+    def index_rows(self, limit=None):
+        """
+        Add the next limit test cases, all by default, to the search index.
+        Return whether all test cases are indexed.
+        """
+
+        start = len(self.search_index)
+        end = self.num_tests if limit is None else min(start + limit, self.num_tests)
+
+        for row in range(start, end):
+            self.search_index.add(self._get_search_text(row))
+
+        return end == self.num_tests
+
+    def search(self, query):
+        """Return the set of rows whose data call, test input or expected output includes query"""
+
+        self.index_rows()
+
+        return self.search_index.search(query)
+
+    def set_search_rows(self, rows):
+        """Show only given rows, or all if None, in a single reset of the view"""
+
+        self.beginResetModel()
+
+        self.search_rows = rows
+        self._update_shown_rows()
+
+        self.endResetModel()
+
+    # Check states
+    def set_checked(self, rows, checked):
+
+        rows = list(rows)
+        check = 1 if checked else 0
+
+        for row in rows:
+            self.num_checked += check - self.checks[row]
+            self.checks[row] = check
+
+        if rows:
+            self._emit_changed(0, 0, [Qt.CheckStateRole])
+
+    def get_checked_rows(self):
+        """Return checked rows in the order of the table, including those not shown"""
+
+        return [row for row in self.order if self.checks[row]]
+
+    # Results
+    def set_results(self, results):
+        """Set (row, status, output) results, repainting them at once"""
+
+        for row, status, output in results:
+            self.statuses[row] = STATUSES.index(status)
+            self.outputs[row] = output
+
+        if results:
+            self._emit_changed(0, len(HEADERS) - 1)
+
+    def clear_results(self):
+
+        self.outputs = [''] * self.num_tests
+        self.statuses = array('B', bytes(self.num_tests))
+
+        self._emit_changed(0, len(HEADERS) - 1)
+
+    def _get_column(self, column):
+
+        columns = (None, self.data_calls, self.test_inputs, self.expected_outputs, self.outputs)
+
+        return columns[column]
+
+    def _get_search_text(self, row):
+        return "\n".join(self._get_column(column)[row] for column in SEARCH_COLUMNS)
+
+    def _update_shown_rows(self):
+
+        if self.search_rows is None:
+            self.shown_rows = array('I', self.order)
+        else:
+            self.shown_rows = array('I', [row for row in self.order if row in self.search_rows])
+
+        self._view_rows = None
+
+    def _get_view_rows(self):
+
+        if self._view_rows is None:
+            self._view_rows = array('i', [-1]) * self.num_tests
+
+            for view_row, row in enumerate(self.shown_rows):
+                self._view_rows[row] = view_row
+
+        return self._view_rows
+
+    def _emit_changed(self, first_column, last_column, roles=()):
+        """
+        Emit a single dataChanged signal spanning all rows shown, of which the
+        view repaints only those within its viewport
+        """
+
+        if not self.shown_rows:
+            return
+
+        self.dataChanged.emit(
+            self.index(0, first_column),
+            self.index(len(self.shown_rows) - 1, last_column),
+            list(roles)
+        )
@@ -1,5 +1,5 @@
 from core.utils import MessageEnum
-from PyQt5.QtWidgets import QMessageBox, QStyledItemDelegate
+from PyQt5.QtWidgets import QMessageBox
 
 
 HOSTS = ["Local Host", "stat.ripe.net"] + [f"dev00{n}.stat.ripe.net" for n in range(1, 9)]
@@ -36,13 +36,6 @@ class StyleEnum():
     INPUT_DISABLED = f"background-color: {ColorEnum.GRAY};"
 
 
-class ReadOnlyDelegator(QStyledItemDelegate):
-    """Make columns read-only"""
-
-    def createEditor(self, parent, option, index):
-        return
-
-
 def throw_message(type, title, message):
 
     msg = QMessageBox()
@@ -3,7 +3,13 @@ import sys
 import argparse
 import asyncio
 
-from core.config import BATCH_SIZE
+from core.config import BATCH_SIZE, POOL_SIZE, POOL_SIZE_PER_HOST, KEEPALIVE_TIMEOUT, \
+    DNS_CACHE_TTL, OFFLOAD_THRESHOLD, SUITE_EXTENSION, RETRIES
+from core.pool import ConnectionPool
+from core.archive import ResponseArchive
+from core.history import LatencyHistory
+from core.sink import ResultSink
+from core.suite import compile_suite
 from scripts.cicd import run_cicd_tests
 from scripts.compare_dc_versions import run_version_comparison
 
@@ -11,6 +17,28 @@ from scripts.compare_dc_versions import run_version_comparison
 if os.path.abspath(".") not in sys.path:
     sys.path.append(os.path.abspath('.'))
 
+
+def get_pool(args):
+    """Return the connection pool configured by args"""
+
+    return ConnectionPool(
+        args.pool_size,
+        args.pool_size_per_host,
+        args.keepalive_timeout,
+        args.dns_cache_ttl
+    )
+
+
+def get_archive(args):
+    """Return the archive to record responses into or replay them from, if any"""
+
+    if args.record:
+        return ResponseArchive(args.record)
+    elif args.replay:
+        return ResponseArchive(args.replay, replay=True)
+    return None
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -24,7 +52,59 @@ if __name__ == "__main__":
         "--batch_size",
         type=str,
         default=str(BATCH_SIZE),
-        help="Batch size. 100 by default."
+        help="Number of test cases kept in flight at once. 100 by default."
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help=(
+            "Adjust the number of test cases in flight to the latency, time-outs and 502s"
+            " of the host, with --batch_size as the maximum"
+        )
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=RETRIES,
+        help=(
+            "Max number of times to retry a request that times out or gets a 502, with"
+            f" backoff and within a retry budget. {RETRIES} by default."
+        )
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help=(
+            "Send a request once more if it takes longer than most of its data call,"
+            " and take whichever response comes first"
+        )
+    )
+    parser.add_argument(
+        "--history",
+        type=str,
+        default="",
+        help="JSON file of latency history per data call, which each run adds its latencies to"
+    )
+    parser.add_argument(
+        "--auto_timeouts",
+        action="store_true",
+        help=(
+            "Derive deadlines of each data call from its latency history given by --history,"
+            " instead of the ones configured in DATA_CALL_MAP"
+        )
+    )
+    parser.add_argument(
+        "--longest_first",
+        action="store_true",
+        help=(
+            "Run test cases in the order of their durations in the latency history given by"
+            " --history, longest first, so that the run does not end on a few slow tests"
+        )
+    )
+    parser.add_argument(
+        "--interleave",
+        action="store_true",
+        help="Let data calls take turns, so that no single data call gets all requests at once"
     )
     parser.add_argument(
         "--path",
@@ -72,12 +152,122 @@ if __name__ == "__main__":
         default=[""],
         help="Data fields to compare"
     )
+    parser.add_argument(
+        "--pool_size",
+        type=int,
+        default=POOL_SIZE,
+        help=f"Max number of open connections, 0 for no limit. {POOL_SIZE} by default."
+    )
+    parser.add_argument(
+        "--pool_size_per_host",
+        type=int,
+        default=POOL_SIZE_PER_HOST,
+        help="Max number of open connections per host, 0 for no limit. No limit by default."
+    )
+    parser.add_argument(
+        "--keepalive_timeout",
+        type=float,
+        default=KEEPALIVE_TIMEOUT,
+        help=f"Seconds to keep idle connections open. {KEEPALIVE_TIMEOUT} by default."
+    )
+    parser.add_argument(
+        "--dns_cache_ttl",
+        type=int,
+        default=DNS_CACHE_TTL,
+        help=f"Seconds to cache resolved host addresses. {DNS_CACHE_TTL} by default."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to partition the test cases across. 1 by default."
+    )
+    parser.add_argument(
+        "--record",
+        type=str,
+        default="",
+        help="Directory to archive every raw response into"
+    )
+    parser.add_argument(
+        "--replay",
+        type=str,
+        default="",
+        help="Directory of archived responses to evaluate instead of querying the host"
+    )
+    parser.add_argument(
+        "--offload_threshold",
+        type=int,
+        default=OFFLOAD_THRESHOLD,
+        help=(
+            "Size in bytes of responses to decode and evaluate in other processes,"
+            " 0 to evaluate all of them in the event loop. 0 by default."
+        )
+    )
+    parser.add_argument(
+        "--latency_export",
+        type=str,
+        default="",
+        help="JSON file to export latency percentiles and histograms per data call into"
+    )
+    parser.add_argument(
+        "--results",
+        type=str,
+        default="",
+        help=(
+            "File to write the result of each test into as soon as it completes,"
+            " as CSV if it ends with .csv, otherwise as JSON lines"
+        )
+    )
+    parser.add_argument(
+        "--compile_suite",
+        type=str,
+        default="",
+        help=(
+            f"Compile the CSV file given by --path into a {SUITE_EXTENSION} file of pre-parsed"
+            " and indexed test cases, which --path accepts as well"
+        )
+    )
     args = parser.parse_args()
 
-    if int(args.batch_size) < 0 or int(args.batch_size) > 200:
-        parser.error("Batch size should be in the range [0, 200]!")
+    if int(args.batch_size) < 1 or int(args.batch_size) > 200:
+        parser.error("Batch size should be in the range [1, 200]!")
+
+    if args.workers < 1:
+        parser.error("Number of workers should be at least 1!")
+
+    if args.retries < 0:
+        parser.error("Number of retries cannot be negative!")
+
+    if args.offload_threshold < 0:
+        parser.error("Offload threshold cannot be negative!")
+
+    if args.auto_timeouts and not args.history:
+        parser.error("--auto_timeouts requires a latency history given by --history!")
+
+    if args.longest_first and not args.history:
+        parser.error("--longest_first requires a latency history given by --history!")
+
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be used together!")
+
+    if args.replay and not os.path.isdir(args.replay):
+        parser.error(f"Replay Error: {args.replay} is not a directory!")
+
+    if args.compile_suite:
+
+        if not args.path.endswith(".csv"):
+            parser.error("File Error: Test cases to compile must be a CSV file!")
+
+        if not args.compile_suite.endswith(SUITE_EXTENSION):
+            parser.error(f"File Error: Compiled suite file must end with {SUITE_EXTENSION}!")
 
-    if args.compare_versions:
+        num_compiled, num_skipped, source_hash = compile_suite(args.path, args.compile_suite)
+
+        print(f"Compiled {num_compiled:,} test cases into {args.compile_suite}")
+        print(f"Skipped malformed rows: {num_skipped:,}")
+        print(f"Source hash (sha256): {source_hash}")
+
+    elif args.compare_versions:
 
         # Argument validation
         if not args.preferred_data_calls:
@@ -97,36 +287,75 @@ if __name__ == "__main__":
         if not args.path.endswith(".txt"):
             parser.error("File Error: Data source must be a text file!")
 
+        pool = get_pool(args)
+        archive = get_archive(args)
+
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(
-            run_version_comparison(
-                args.host,
-                int(args.batch_size),
-                args.path,
-                args.limit,
-                args.preferred_data_calls.pop(),
-                args.comparison_fields.pop()
+
+        try:
+            loop.run_until_complete(
+                run_version_comparison(
+                    args.host,
+                    int(args.batch_size),
+                    args.path,
+                    args.limit,
+                    args.preferred_data_calls.pop(),
+                    args.comparison_fields.pop(),
+                    pool,
+                    archive
+                )
             )
-        )
+        finally:
+            loop.run_until_complete(pool.close())
+
+            if archive is not None:
+                archive.close()
 
     elif args.host:
 
         if not args.path:
             args.path = "data/test_cases_500.csv"
 
+        pool = get_pool(args)
+        archive = get_archive(args)
+        sink = ResultSink(args.results) if args.results else None
+
         # The asyncio.run() function was added in Python 3.7
         # asyncio.run(run_cicd_tests(args.host, args.mode))
         # The solution below is for compatibility concerns for the systems with Python < 3.7
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(
-            run_cicd_tests(
-                args.host,
-                int(args.batch_size),
-                args.path,
-                int(args.random),
-                args.preferred_data_calls.pop()
+
+        try:
+            loop.run_until_complete(
+                run_cicd_tests(
+                    args.host,
+                    int(args.batch_size),
+                    args.path,
+                    int(args.random) if args.random else None,
+                    args.preferred_data_calls.pop(),
+                    pool,
+                    args.workers,
+                    archive,
+                    args.offload_threshold,
+                    args.latency_export,
+                    sink,
+                    args.adaptive,
+                    args.retries,
+                    args.hedge,
+                    LatencyHistory(args.history) if args.history else None,
+                    args.auto_timeouts,
+                    args.longest_first,
+                    args.interleave
+                )
             )
-        )
+        finally:
+            loop.run_until_complete(pool.close())
+
+            if archive is not None:
+                archive.close()
+
+            if sink is not None:
+                sink.close()
 
     # GUI usage
     else:
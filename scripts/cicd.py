@@ -1,149 +1,614 @@
+import json
 import time
 import asyncio
+import multiprocessing
 from math import ceil
-from collections import namedtuple, Counter
-
+from zlib import crc32
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from core.config import PROGRESS_INTERVAL, TIMING_PHASES, RETRIES
+from core.plan import compile_plan
+from core.concurrency import ConcurrencyLimit
+from core.model import TestResult
+from core.histogram import LatencyHistogram, PERCENTILES
+from core.history import LatencyHistory, get_test_key
+from core.pool import ConnectionPool
 from core.teststat import TestStat
 from core.utils import MessageEnum, MATTERMOST_NEWLINE, MATTERMOST_TABLE_FRAME, \
-    parse_csv, get_batch, post_message, process_stats
+    parse_csv, order_test_cases, run_in_window, post_message, process_stats, format_timing
 
 
-async def run_cicd_tests(host, batch_size, test_source, random, preferred_data_calls):
-    """Run CICD test cases for given host and given test source"""
+def format_attempts(attempts):
+    """Format the tries of a retried request, e.g. 'timed out (15000.0 ms) | ok (41.2 ms)'"""
 
-    async def _run_routine(row_index, row, dc_version):
+    outcomes = {
+        None: "ok",
+        MessageEnum.TIMEOUT: "timed out",
+        MessageEnum.BAD_GATEWAY: "bad gateway",
+        MessageEnum.CONNECTION_ERROR: "connection error"
+    }
 
-        data_call = row[0]
-        test_input = row[1].replace(' ', '').replace('&', ',').replace(';', '&')
-        if dc_version:
-            test_input += f"&preferred_version={dc_version}"
+    return " | ".join(
+        f"{outcomes.get(attempt['error'], attempt['error'])} ({attempt['seconds'] * 1000:.1f} ms)"
+        for attempt in attempts
+    )
 
-        expected_output = {}
-        for param_value_pair in row[2].split(';'):
-            param, value = param_value_pair.replace(' ', '').split('=', 1)
-            expected_output[param] = value.replace('&', ',')
 
-        test_output, url = await teststat.run_test(data_call, test_input, expected_output, True)
+def format_failure(result):
 
-        data_call = data_call.replace('-', ' ').title()
-        if dc_version:
-            data_call += f" (v{dc_version})"
+    test_case = result.test_case
+    expected_output = test_case.expected_output
 
-        if test_output == MessageEnum.TIMEOUT:
-            stat = TimeoutStat(
-                test_case=row_index,
-                data_call=data_call,
-                url=url,
-                expected_output=expected_output
-            )
-            stats["time_out"].append(stat)
+    lines = [
+        f"\nFailed Test Case: {test_case.row_index} | Data Call: {test_case.title} "
+        f"| URL: {result.url}"
+    ]
 
-        elif test_output == MessageEnum.BAD_GATEWAY:
-            stat = FailureStat(
-                test_case=row_index,
-                data_call=data_call,
-                url=url,
-                expected_output=expected_output,
-                actual_output={"error": "502 Bad Gateway"}
-            )
-            stats["failure"].append(stat)
+    if "status_code" in result.output:
+        lines.append(f"--> Status Code:  {result.output['status_code']}")
 
-        elif test_output:
-            stat = FailureStat(
-                test_case=row_index,
-                data_call=data_call,
-                url=url,
-                expected_output=expected_output,
-                actual_output=test_output
+    if "error" in result.output:
+        for param, expected_value in expected_output.items():
+            lines.append(f"--> Parameter '{param}' | Expected: {expected_value}")
+        lines.append(f"   --> Error:  {result.output['error']}")
+    else:
+        for param, actual_value in result.output.items():
+
+            # Nested params fail as a group, reported by their root param
+            expected_value = expected_output.get(param) or {
+                expected_param: value
+                for expected_param, value in expected_output.items()
+                if expected_param.split("->")[0] == param
+            }
+
+            lines.append(
+                f"--> Parameter '{param}':"
+                f"   --> Expected: {expected_value} | Actual: {actual_value}"
             )
-            stats["failure"].append(stat)
 
-    teststat = TestStat(host)
+    if result.attempts:
+        lines.append(f"--> Attempts: {format_attempts(result.attempts)}")
+
+    return "\n".join(lines)
+
+
+def format_time_out(result):
+
+    test_case = result.test_case
+
+    lines = [
+        f"\nTimed-out Test Case: {test_case.row_index} | Data Call: {test_case.title} "
+        f"| URL: {result.url}"
+    ]
+
+    for param, expected_value in test_case.expected_output.items():
+        lines.append(f"--> Parameter '{param}' | Expected: {expected_value}")
+    lines.append(f"--> Timing: {format_timing(result.timing)}")
+
+    if result.attempts:
+        lines.append(f"--> Attempts: {format_attempts(result.attempts)}")
+
+    return "\n".join(lines)
 
-    stats = {"failure": [], "time_out": []}
-    FailureStat = namedtuple(
-        "Failure",
-        ["test_case", "data_call", "url", "expected_output", "actual_output"]
+
+def format_flake(result):
+
+    test_case = result.test_case
+
+    return (
+        f"\nFlaked Test Case: {test_case.row_index} | Data Call: {test_case.title} "
+        f"| URL: {result.url}\n"
+        f"--> Passed after retrying. Attempts: {format_attempts(result.attempts)}"
     )
-    TimeoutStat = namedtuple("Timeout", ["test_case", "data_call", "url", "expected_output"])
 
-    test_cases = parse_csv(test_source, preferred_data_calls, random)
 
-    test_counts_per_dc = Counter([test_case[0] for _, test_case, _ in test_cases])
-    total_test_cases = len(test_cases)
-    num_batches = ceil(total_test_cases / batch_size)
+async def run_test_cases(
+    host,
+    window_size,
+    test_cases,
+    pool=None,
+    archive=None,
+    worker_index=None,
+    offload_threshold=0,
+    sink=None,
+    adaptive=False,
+    retries=RETRIES,
+    hedge=False,
+    history=None,
+    auto_timeouts=False
+):
+    """
+    Run given test cases against host while keeping window_size of them in
+    flight. test_cases is a list or an iterator, which is consumed only as
+    fast as test cases are started. Failures and time-outs are printed, and
+    all results written into sink if given, as soon as they complete. Returns
+    stats aggregated per data call: failed and timed-out URLs, seconds spent
+    per phase and latency histograms. Responses of at least offload_threshold
+    bytes are evaluated in other processes, if not 0. If adaptive, the number
+    of tests in flight is adjusted to the load the host can take, up to
+    window_size. Requests that time out or get a 502 are retried up to retries
+    times, and tests that pass only then are reported as flaked rather than
+    failed. If hedge, requests straggling behind their data call are raced by
+    a duplicate. If history is given, latencies of the tests are recorded into
+    a new LatencyHistory in the stats, and if auto_timeouts, deadlines per
+    data call are derived from history.
+    """
+
+    async def _run_routine(test_case):
+
+        # expected_output itself is kept intact for the report
+        plan = compile_plan(test_case.data_call, test_case.expected_output)
+
+        start_time = time.perf_counter()
+
+        test_output, url, timing = await teststat.run_test(
+            test_case.data_call,
+            test_case.query_input,
+            plan,
+            return_url=True,
+            return_timing=True
+        )
+
+        latency = time.perf_counter() - start_time
+        attempts = timing.pop("attempts", None)
 
-    print("\n", "#" * 100, "\n\n")
-    print(f"Host: {host}   |   Test Source: {test_source}\n\n")
+        data_call = test_case.title
 
-    start_time = time.time()
+        timing_per_dc = stats["timing"].setdefault(data_call, Counter())
+        timing_per_dc.update(timing)
+        timing_per_dc["tests"] += 1
+        stats["latency"].setdefault(data_call, LatencyHistogram()).record(latency)
 
-    # Create an event loop for a batch of coroutines, and proceed to the next when it's done
-    for batch_index, batch in enumerate(get_batch(test_cases, batch_size), 1):
+        if adaptive:
+            # Retried tries count as much as failed tests
+            window.record(
+                data_call,
+                latency,
+                bool(attempts)
+                or test_output == MessageEnum.TIMEOUT
+                or test_output == MessageEnum.BAD_GATEWAY
+            )
 
-        await asyncio.gather(
-            *[_run_routine(row_index, row, version) for row_index, row, version in batch]
+        # Tests cut off by a deadline or an error would skew the history, and
+        # tests sharing the request of another one are recorded by that one
+        if history is not None and not isinstance(test_output, int) and "shared" not in timing:
+            stats["history"].record(test_case, latency, timing, attempts)
+
+        result = TestResult(
+            test_case,
+            TestResult.FAILED,
+            url=url,
+            latency=latency,
+            timing=timing,
+            attempts=attempts,
+            error=test_output if isinstance(test_output, int) else None
         )
-        print(f"-> Batch {batch_index}/{num_batches} has been completed!")
 
-    # Close the session when all batches are done
-    await teststat.session.close()
+        if test_output == MessageEnum.TIMEOUT:
+            result.status = TestResult.TIMED_OUT
+        elif test_output == MessageEnum.BAD_GATEWAY:
+            result.output = {"error": "502 Bad Gateway"}
+        elif test_output == MessageEnum.NOT_RECORDED:
+            result.output = {"error": "No recorded response to replay"}
+        elif test_output == MessageEnum.CONNECTION_ERROR:
+            result.output = {"error": "Connection error"}
+        elif test_output:
+            result.output = test_output
+        else:
+            result.status = TestResult.PASSED
+
+        if result.status == TestResult.TIMED_OUT:
+            stats["timed_out_queries"].setdefault(data_call, []).append(url)
+            print(format_time_out(result), flush=True)
+
+        elif result.status == TestResult.FAILED:
+            stats["failed_queries"].setdefault(data_call, []).append(url)
+            print(format_failure(result), flush=True)
+
+        elif result.flaked:
+            stats["flaked_queries"].setdefault(data_call, []).append(url)
+            print(format_flake(result), flush=True)
+
+        if sink is not None:
+            sink.write(**result.to_dict())
+
+            # Failures and time-outs are what a killed run should keep the most
+            if result.status != TestResult.PASSED:
+                sink.flush()
+
+    teststat = TestStat(
+        host,
+        pool=pool,
+        archive=archive,
+        offload_threshold=offload_threshold,
+        retries=retries,
+        hedge=hedge,
+        history=history if auto_timeouts else None
+    )
 
-    stats["failure"].sort(key=lambda tuple: tuple.test_case)
-    stats["time_out"].sort(key=lambda tuple: tuple.test_case)
-    num_failure = len(stats["failure"])
-    num_time_out = len(stats["time_out"])
+    stats = {
+        "failed_queries": {},
+        "timed_out_queries": {},
+        "flaked_queries": {},
+        "timing": {},
+        "latency": {},
+        "history": LatencyHistory()
+    }
 
-    if stats["failure"]:
+    # The total is not known in advance if test cases are streamed
+    total_test_cases = len(test_cases) if isinstance(test_cases, list) else None
+    progress_prefix = "-> " if worker_index is None else f"-> Worker {worker_index}: "
 
-        print("\nFAILED TEST CASES:\n")
+    last_report_time = time.time()
+    num_completed = 0
 
-        for tuple in stats["failure"]:
-            print(
-                f"\nTest Case: {tuple.test_case} | Data Call: {tuple.data_call} | URL: {tuple.url}"
-            )
+    # Keep window_size test cases in flight, starting a new one as soon as any completes
+    window = ConcurrencyLimit(window_size) if adaptive else window_size
+    routines = (_run_routine(test_case) for test_case in test_cases)
 
-            if "status_code" in tuple.actual_output:
-                print("--> Status Code: ", tuple.actual_output["status_code"])
+    # Results are flushed into sink on a timer, so that they are kept even if
+    # the run is killed while slow tests keep the others from completing
+    flusher = asyncio.ensure_future(sink.flush_periodically()) if sink is not None else None
 
-            if "error" in tuple.actual_output:
-                for param, expected_value in tuple.expected_output.items():
-                    print(f"--> Parameter '{param}' | Expected: {expected_value}")
-                print("   --> Error: ", tuple.actual_output["error"])
-            else:
-                for param, expected_value in tuple.expected_output.items():
+    try:
+        async for _ in run_in_window(routines, window):
+
+            num_completed += 1
+
+            if time.time() - last_report_time >= PROGRESS_INTERVAL \
+                    or num_completed == total_test_cases:
+                last_report_time = time.time()
+
+                if total_test_cases is None:
+                    print(f"{progress_prefix}{num_completed:,} test cases have been completed!")
+                else:
                     print(
-                        f"--> Parameter '{param}':"
-                        f"   --> Expected: {expected_value} | Actual: {tuple.actual_output[param]}"
+                        f"{progress_prefix}{num_completed:,}/{total_test_cases:,} "
+                        "test cases have been completed!"
                     )
+    finally:
+        if flusher is not None:
+            flusher.cancel()
+
+    if total_test_cases is None:
+        print(f"{progress_prefix}All {num_completed:,} test cases have been completed!")
+
+    if adaptive:
+        print(f"{progress_prefix}{window.format_stats()}")
+
+    stats["num_tests"] = num_completed
+    stats["saved_requests"] = teststat.num_saved_requests
+    stats["retries"] = teststat.retry_policy.num_retries
+    stats["denied_retries"] = teststat.retry_policy.num_denied
+
+    if hedge:
+        stats["hedges"] = teststat.hedge_policy.num_hedges
+        stats["hedge_wins"] = teststat.hedge_policy.num_hedge_wins
+    else:
+        stats["hedges"] = stats["hedge_wins"] = 0
+
+    # Close the session when all test cases are done
+    await teststat.close()
+
+    return stats
+
+
+def run_shard(
+    host,
+    window_size,
+    test_cases,
+    pool,
+    archive,
+    worker_index,
+    offload_threshold,
+    sink,
+    adaptive,
+    retries,
+    hedge,
+    history,
+    auto_timeouts
+):
+    """
+    Entry point of a worker process. Run a shard of test cases on an event
+    loop and a pool of connections of its own, return stats to the parent.
+    """
+
+    async def _run():
+        try:
+            return await run_test_cases(
+                host,
+                window_size,
+                test_cases,
+                pool,
+                archive,
+                worker_index,
+                offload_threshold,
+                sink,
+                adaptive,
+                retries,
+                hedge,
+                history,
+                auto_timeouts
+            )
+        finally:
+            await pool.close()
+
+            if archive is not None:
+                archive.close()
+
+            if sink is not None:
+                sink.close()
+
+    return asyncio.run(_run()), pool.stats
+
+
+async def run_cicd_tests(
+    host,
+    batch_size,
+    test_source,
+    random,
+    preferred_data_calls,
+    pool=None,
+    workers=1,
+    archive=None,
+    offload_threshold=0,
+    latency_export="",
+    sink=None,
+    adaptive=False,
+    retries=RETRIES,
+    hedge=False,
+    history=None,
+    auto_timeouts=False,
+    longest_first=False,
+    interleave=False
+):
+    """
+    Run CICD test cases for given host and given test source. batch_size is
+    the number of test cases kept in flight at once. If pool is given, its
+    connections are used for the queries and it is left open afterwards.
+    If archive is given, responses are recorded into or replayed from it.
+    Responses of at least offload_threshold bytes are decoded and evaluated
+    in a process pool, so that they do not block the event loop. Latency
+    histograms per data call are written into latency_export as JSON, if given.
+    If sink is given, the result of each test is written into it. If
+    adaptive, batch_size is the maximum number of test cases in flight, and
+    the actual number follows the load the host can take, see ConcurrencyLimit.
+    Requests that time out or get a 502 are retried up to retries times
+    within a retry budget, see RetryPolicy. If hedge, requests straggling
+    behind the latency of their data call are sent once more, see HedgePolicy.
+    If history is given, the latencies of this run are added to it and saved.
+    If auto_timeouts, deadlines of data calls are derived from history rather
+    than configured in DATA_CALL_MAP, see LatencyHistory. If longest_first,
+    test cases run in the order of their durations in history, longest first,
+    and if interleave, data calls take turns, see order_test_cases. Test
+    cases are then all read before running them.
+
+    If workers > 1, test cases are partitioned across that many processes,
+    each running its share of the batch_size window, and their stats are
+    merged into a single report.
+    """
+
+    owns_pool = pool is None
+    if owns_pool:
+        pool = ConnectionPool()
+
+    num_skipped = 0
+
+    def _read_test_cases():
+        nonlocal num_skipped
+        num_skipped = yield from parse_csv(test_source, preferred_data_calls, random)
+
+    # Test cases are read while running them, unless they are ordered or split into shards
+    test_cases = _read_test_cases()
+
+    if longest_first or interleave:
+        test_cases = order_test_cases(
+            test_cases,
+            history if longest_first else None,
+            interleave
+        )
 
-    if stats["time_out"]:
+    print("\n", "#" * 100, "\n\n")
+    print(f"Host: {host}   |   Test Source: {test_source}\n\n")
 
-        if stats["failure"]:
-            print("\n", "-" * 100, "\n")
-        print("TIMED-OUT TEST CASES:\n")
+    start_time = time.time()
 
-        for tuple in stats["time_out"]:
+    if workers == 1:
+        stats = await run_test_cases(
+            host,
+            batch_size,
+            test_cases,
+            pool,
+            archive,
+            offload_threshold=offload_threshold,
+            sink=sink,
+            adaptive=adaptive,
+            retries=retries,
+            hedge=hedge,
+            history=history,
+            auto_timeouts=auto_timeouts
+        )
+
+    else:
+        # Test cases are partitioned by a hash of their query, so identical
+        # queries land in the same worker and are still sent only once there
+        shards = [[] for _ in range(workers)]
+        for test_case in test_cases:
+            shards[crc32(get_test_key(test_case).encode()) % workers].append(test_case)
+
+        window_size = ceil(batch_size / workers)
+        loop = asyncio.get_running_loop()
+
+        # Workers are spawned rather than forked, so that none of them inherits
+        # the event loop or open connections of this process.
+        with ProcessPoolExecutor(workers, multiprocessing.get_context("spawn")) as executor:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(
+                    executor,
+                    run_shard,
+                    host,
+                    window_size,
+                    shard,
+                    pool,
+                    archive,
+                    index,
+                    offload_threshold,
+                    sink.for_worker(index) if sink is not None else None,
+                    adaptive,
+                    retries,
+                    hedge,
+                    history,
+                    auto_timeouts
+                )
+                for index, shard in enumerate(shards, 1) if shard
+            ])
+
+        stats = {
+            "failed_queries": {},
+            "timed_out_queries": {},
+            "flaked_queries": {},
+            "timing": {},
+            "latency": {},
+            "num_tests": 0,
+            "saved_requests": 0,
+            "retries": 0,
+            "denied_retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "history": LatencyHistory()
+        }
+
+        for shard_stats, pool_stats in results:
+            for key in [
+                "num_tests",
+                "saved_requests",
+                "retries",
+                "denied_retries",
+                "hedges",
+                "hedge_wins"
+            ]:
+                stats[key] += shard_stats[key]
+
+            for key in ["failed_queries", "timed_out_queries", "flaked_queries"]:
+                for data_call, urls in shard_stats[key].items():
+                    stats[key].setdefault(data_call, []).extend(urls)
+
+            for data_call, timing in shard_stats["timing"].items():
+                stats["timing"].setdefault(data_call, Counter()).update(timing)
+
+            for data_call, histogram in shard_stats["latency"].items():
+                stats["latency"].setdefault(data_call, LatencyHistogram()).merge(histogram)
+
+            stats["history"].merge(shard_stats["history"])
+
+            for key, value in pool_stats.items():
+                pool.stats[key] += value
+
+    if owns_pool:
+        await pool.close()
+
+    if history is not None:
+        history.merge(stats["history"])
+        history.save()
+
+    total_test_cases = stats["num_tests"]
+    num_failure = sum(len(urls) for urls in stats["failed_queries"].values())
+    num_time_out = sum(len(urls) for urls in stats["timed_out_queries"].values())
+    num_flake = sum(len(urls) for urls in stats["flaked_queries"].values())
+
+    if stats["timing"]:
+
+        print("\n", "-" * 100, "\n")
+        print("MEAN TIME PER TEST (ms):\n")
+        print(f"{'Data Call':<40}{'Tests':>8}" + "".join(f"{phase:>10}" for phase in TIMING_PHASES))
+
+        for data_call, timing in sorted(stats["timing"].items()):
+            mean_times = [timing[phase] / timing["tests"] * 1000 for phase in TIMING_PHASES]
+            print(
+                f"{data_call:<40}{timing['tests']:>8,}"
+                + "".join(f"{mean_time:>10.1f}" for mean_time in mean_times)
+            )
+
+    if stats["latency"]:
+
+        print("\n", "-" * 100, "\n")
+        print("LATENCY PER TEST (ms):\n")
+        print(
+            f"{'Data Call':<40}{'Tests':>8}"
+            + "".join(f"{f'p{percent}':>10}" for percent in PERCENTILES)
+            + f"{'max':>10}"
+        )
+
+        for data_call, histogram in sorted(stats["latency"].items()):
+            summary = histogram.summary()
             print(
-                f"\nTest Case: {tuple.test_case} | Data Call: {tuple.data_call} | URL: {tuple.url}"
+                f"{data_call:<40}{histogram.count:>8,}"
+                + "".join(f"{summary[f'p{percent}']:>10.1f}" for percent in PERCENTILES)
+                + f"{summary['max']:>10.1f}"
+            )
+
+    if latency_export:
+        with open(latency_export, "w") as file_writer:
+            json.dump(
+                {
+                    "host": host,
+                    "test_source": test_source,
+                    "data_calls": {
+                        data_call: histogram.to_dict()
+                        for data_call, histogram in sorted(stats["latency"].items())
+                    }
+                },
+                file_writer,
+                indent=4
             )
-            for param, expected_value in tuple.expected_output.items():
-                print(f"--> Parameter '{param}' | Expected: {expected_value}")
 
     header = f"**Host:** {host}   |   **Test Source:** {test_source}\n\n"
 
     print("\n", "#" * 100, "\n")
     print(f"Test Cases:           {total_test_cases:,}")
+
+    if num_skipped:
+        print(f"Skipped Rows:         {num_skipped:,} (malformed)")
+
     print(f"Failed Test Cases:    {num_failure:,}")
-    print(f"Timed-out Test Cases: {num_time_out:,}\n")
+    print(f"Timed-out Test Cases: {num_time_out:,}")
+
+    if retries:
+        print(f"Flaked Test Cases:    {num_flake:,} (passed after retrying)")
+
+    print(f"\n{pool.format_stats()}")
+    print(f"Requests saved by sharing identical queries: {stats['saved_requests']:,}\n")
+
+    if retries:
+        print(
+            f"Retries: {stats['retries']:,}   |   "
+            f"Denied by the retry budget: {stats['denied_retries']:,}\n"
+        )
+
+    if hedge:
+        print(
+            f"Hedged requests: {stats['hedges']:,}   |   "
+            f"Answered first by the hedge: {stats['hedge_wins']:,}\n"
+        )
+
+    if history is not None:
+        print(f"Latency history saved into {history.path}\n")
 
     # Prepare a message to be posted in Mattermost channel
     header += f"**- Total Test Cases:**           {total_test_cases:,}" + "\n"
     header += f"**- Failed Test Cases:**         {num_failure:,}"
     header += "     :flan_cool:\n" if not num_failure else "\n"
     header += f"**- Timed-out Test Cases:** {str(num_time_out)}"
-    header += "     :flan_cool:\n\n" if not num_time_out else "\n\n"
+    header += "     :flan_cool:\n" if not num_time_out else "\n"
+
+    if retries:
+        header += f"**- Flaked Test Cases:**         {num_flake:,} (passed after retrying)\n"
+
+    header += "\n"
 
+    # Only data calls with failures or time-outs are posted, percentiles of
+    # all data calls are printed above
     if num_failure or num_time_out:
         processed_stats = process_stats(stats)
 
@@ -151,7 +616,10 @@ async def run_cicd_tests(host, batch_size, test_source, random, preferred_data_c
 
         for data_call, data_call_stats in processed_stats.items():
 
-            num_tests = test_counts_per_dc[data_call]
+            histogram = stats["latency"].get(data_call, LatencyHistogram())
+            summary = histogram.summary()
+
+            num_tests = histogram.count
             num_failure = len(data_call_stats["failed_queries"])
             num_time_out = len(data_call_stats["timed_out_queries"])
 
@@ -172,7 +640,15 @@ async def run_cicd_tests(host, batch_size, test_source, random, preferred_data_c
             else:
                 queries = timed_out_queries
 
-            msg_table += f"|{data_call}|{num_tests:,}|{num_failure:,}|{num_time_out:,}|{queries}|\n"
+            latencies = "|".join(
+                [f"{summary[f'p{percent}']:,.0f}" for percent in PERCENTILES]
+                + [f"{summary['max']:,.0f}"]
+            )
+
+            msg_table += (
+                f"|{data_call}|{num_tests:,}|{num_failure:,}|{num_time_out:,}"
+                f"|{latencies}|{queries}|\n"
+            )
 
         header += msg_table
 
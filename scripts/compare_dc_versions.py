@@ -1,10 +1,11 @@
 import os
-import asyncio
-from math import ceil
+import time
 from collections import defaultdict
 
+from core.model import TestCase
 from core.teststat import TestStat
-from core.utils import get_batch, compare_output_equality
+from core.config import PROGRESS_INTERVAL
+from core.utils import run_in_window, compare_output_equality
 
 
 async def run_version_comparison(
@@ -13,18 +14,24 @@ async def run_version_comparison(
     txt_path,
     limit,
     dc_with_versions,
-    comparison_fields
+    comparison_fields,
+    pool=None,
+    archive=None
 ):
 
-    async def _run_routine(test_input):
+    async def _run_routine(test_case):
 
-        expected_output = {"status_code": "200"}
-        test_output = await teststat.run_test(dc, test_input, expected_output, return_data=True)
-        output_per_version[test_input.split('&')[0]].append(test_output)
+        test_output = await teststat.run_test(
+            test_case.data_call,
+            test_case.query_input,
+            test_case.expected_output,
+            return_data=True
+        )
+        output_per_version[test_case.test_input].append(test_output)
 
-    teststat = TestStat(host)
+    teststat = TestStat(host, pool=pool, archive=archive)
     output_per_version = defaultdict(list)
-    test_inputs = []
+    test_cases = []
     mismatched_inputs = []
     dc, *versions = dc_with_versions.split('_')
 
@@ -46,23 +53,34 @@ async def run_version_comparison(
 
         resources = [resource.replace('\"', '').replace(',', '').strip() for resource in lines]
 
-    for resource in resources:
+    expected_output = {"status_code": "200"}
+
+    for row_index, resource in enumerate(resources, 1):
+        test_case = TestCase(row_index, dc, f"resource={resource}", expected_output)
+
         for version in versions:
-            test_inputs.append(f"resource={resource}&preferred_version={version}")
+            test_cases.append(test_case.renumber(row_index, version))
 
-    total_test_cases = len(test_inputs)
+    total_test_cases = len(test_cases)
     num_mismatch = 0
-    num_batches = ceil(total_test_cases / batch_size)
+    last_report_time = time.time()
+    num_completed = 0
+
+    # Keep batch_size queries in flight, starting a new one as soon as any completes
+    routines = (_run_routine(test_case) for test_case in test_cases)
+
+    async for _ in run_in_window(routines, batch_size):
 
-    # Create an event loop for a batch of coroutines, and proceed to the next when it's done
-    for batch_index, batch in enumerate(get_batch(test_inputs, batch_size), 1):
+        num_completed += 1
 
-        await asyncio.gather(*[_run_routine(test_input) for test_input in batch])
+        if time.time() - last_report_time >= PROGRESS_INTERVAL or num_completed == total_test_cases:
+            last_report_time = time.time()
+            print(f"-> {num_completed:,}/{total_test_cases:,} queries have been completed!")
 
-        print(f"-> Batch {batch_index}/{num_batches} has been completed!")
+    print(f"\n{teststat.pool.format_stats()}")
 
-    # Close the session when all batches are done
-    await teststat.session.close()
+    # Close the session when all queries are done
+    await teststat.close()
 
     for input, outputs in output_per_version.items():
         if compare_output_equality(comparison_fields, *outputs) is not True: